@@ -1,117 +1,140 @@
 import os
+import copy
+import hashlib
 import json
-import openai
 import logging
-from dotenv import load_dotenv
+import threading
+import time
+from collections import Counter
+
+import condense
+from gpt_cache import ResponseCache
+from metrics import metrics
+from herb_schema import build_template, find_empty_fields, set_path
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
 logger = logging.getLogger(__name__)
 
-# Load environment variables from .env
-load_dotenv()
-
-# Get the API key
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    logger.error("API key not found. Check your .env file.")
-    exit(1)
-
-# Initialize the OpenAI client
-client = openai.OpenAI(api_key=api_key)
-
-
-def find_empty_fields(data):
-    empties = []
-
-    # Top-level fields in Herb
-    herb = data.get("Herb", {})
-    if not herb.get("Name", "").strip():
-        empties.append("Herb.Name")
-    if not herb.get("LatinName", "").strip():
-        empties.append("Herb.LatinName")
-    if not herb.get("Description", "").strip():
-        empties.append("Herb.Description")
-    if not herb.get("Dosage", "").strip():
-        empties.append("Herb.Dosage")
-    if not herb.get("Tags"):
-        empties.append("Herb.Tags")
-    if not herb.get("Sources", "").strip():
-        empties.append("Herb.Sources")
-
-    # AilmentsTreated
-    ailments = herb.get("AilmentsTreated", [])
-    if not ailments or not ailments[0].get("Name", "").strip():
-        empties.append("Herb.AilmentsTreated[0].Name")
-    if not ailments or not ailments[0].get("Description", "").strip():
-        empties.append("Herb.AilmentsTreated[0].Description")
-
-    # SideEffects
-    effects = herb.get("SideEffects", [])
-    if not effects or not effects[0].get("Name", "").strip():
-        empties.append("Herb.SideEffects[0].Name")
-    if not effects or not effects[0].get("Description", "").strip():
-        empties.append("Herb.SideEffects[0].Description")
-    if not effects or not effects[0].get("Severity", "").strip():
-        empties.append("Herb.SideEffects[0].Severity")
-
-    # HerbPreparationSteps
-    steps = data.get("HerbPreparationSteps", [])
-    if not steps or not steps[0].get("StepName", "").strip():
-        empties.append("HerbPreparationSteps[0].StepName")
-    if not steps or not steps[0].get("Description", "").strip():
-        empties.append("HerbPreparationSteps[0].Description")
-    if not steps or not steps[0].get("Duration", "").strip():
-        empties.append("HerbPreparationSteps[0].Duration")
-    if not steps or not steps[0].get("Temperature", "").strip():
-        empties.append("HerbPreparationSteps[0].Temperature")
-    if not steps or not steps[0].get("Type", "").strip():
-        empties.append("HerbPreparationSteps[0].Type")
-    if not steps or not steps[0].get("Order"):
-        empties.append("HerbPreparationSteps[0].Order")
-
-    # HerbWarnings
-    warnings = data.get("HerbWarnings", [])
-    if not warnings or not warnings[0].get("WarningTitle", "").strip():
-        empties.append("HerbWarnings[0].WarningTitle")
-    if not warnings or not warnings[0].get("Description", "").strip():
-        empties.append("HerbWarnings[0].Description")
-    if not warnings or not warnings[0].get("WarningType", "").strip():
-        empties.append("HerbWarnings[0].WarningType")
-    if not warnings or not warnings[0].get("Order"):
-        empties.append("HerbWarnings[0].Order")
-
-    # ScientificStudies
-    studies = data.get("ScientificStudies", [])
-    if not studies or not studies[0].get("StudyTitle", "").strip():
-        empties.append("ScientificStudies[0].StudyTitle")
-    if not studies or not studies[0].get("Summary", "").strip():
-        empties.append("ScientificStudies[0].Summary")
-    if not studies or not studies[0].get("DOI", "").strip():
-        empties.append("ScientificStudies[0].DOI")
-    if not studies or not studies[0].get("ExternalLink", "").strip():
-        empties.append("ScientificStudies[0].ExternalLink")
-
-    # Tags
-    tags = data.get("Tags", [])
-    if not tags or not tags[0].get("Name", "").strip():
-        empties.append("Tags[0].Name")
-
-    return empties
+# The OpenAI client and the reply cache are created on first use (get_client / get_response_cache),
+# so importing this module is cheap and works without an API key.
+client = None
+response_cache = None
+_init_lock = threading.Lock()
 
+# Replies are cached on disk by request, so re-runs don't pay for unchanged prompts again.
+# Set GPT_CACHE_BYPASS=1 to ignore cached replies (fresh replies are still stored).
+CACHE_FILE = "gpt_cache.sqlite"
+CACHE_MAX_MB = 500
+# Shard workers on several hosts share the cache file, which WAL does not support; they set this to False.
+CACHE_WAL = True
 
-def extract_herb_info_with_gpt(entry):
+
+def load_env():
+    from dotenv import load_dotenv
+    # Load environment variables from .env
+    load_dotenv()
+
+
+def get_client():
+    global client
+    with _init_lock:
+        if client is None:
+            import openai
+            load_env()
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise RuntimeError("OpenAI API key not found. Set OPENAI_API_KEY or add it to your .env file.")
+            client = openai.OpenAI(api_key=api_key)
+    return client
+
+
+def get_response_cache():
+    global response_cache
+    with _init_lock:
+        if response_cache is None:
+            load_env()
+            response_cache = ResponseCache(CACHE_FILE, CACHE_MAX_MB * 1024 * 1024, bypass=os.getenv("GPT_CACHE_BYPASS") == "1", wal=CACHE_WAL)
+    return response_cache
+
+
+# Model cascade: each step runs on the first (cheapest) tier and moves up a tier only when the reply
+# is not usable — not valid JSON, PFAF_REQUIRED_FIELDS left empty (step 1) or fields still empty
+# after the fill-in (step 2). The last tier's answer is kept either way.
+MODEL_TIERS = ["gpt-4o-mini", "gpt-4"]
+MODEL = MODEL_TIERS[0]
+# Fields every PFAF page has the facts for; a step-1 reply without them goes up a tier.
+PFAF_REQUIRED_FIELDS = ["Herb.Name", "Herb.Description"]
+# USD per million (prompt, completion) tokens, for the cost report. Update when prices change.
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4": (30.00, 60.00),
+}
+SYSTEM_PROMPT = "You are a helpful herbal medicine assistant."
+
+# "delta": step 2 asks only for the empty paths and merges the partial reply here.
+# "full": step 2 sends the whole JSON and gets the whole JSON back (the original behaviour).
+FILL_MODE = "delta"
+
+# Source text is deduplicated and, when over budget, cut down to the most relevant paragraphs.
+PFAF_TOKEN_BUDGET = 2500
+FILL_TOKEN_BUDGET = 3000
+
+usage_totals = {}
+_usage_lock = threading.Lock()
+
+
+def build_request(prompt, temperature, model=MODEL, max_tokens=1000):
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+
+
+# Condensation savings of every prompt built, by prompt hash: {hash: (latin, tokens before, tokens after)}.
+# Prompts are rebuilt on every cache lookup (and every batch `write`), so savings are only counted
+# by `record_sent`, once per request that actually goes out.
+_prompt_savings = {}
+
+
+def _prompt_hash(request):
+    return hashlib.sha256(request["messages"][-1]["content"].encode("utf-8")).hexdigest()
+
+
+def record_sent(request):
+    saved = _prompt_savings.get(_prompt_hash(request))
+    if saved:
+        condense.record_savings(*saved)
+
+
+def parse_json_reply(content):
+    return json.loads(content.strip().strip("```json").strip("```"))
+
+
+def pfaf_text_usable(entry):
+    text_pfaf = entry.get("textpfaf", "").strip().lower()
+    return bool(text_pfaf) and "error" not in text_pfaf and "not found" not in text_pfaf
+
+
+def pfaf_request(entry, model=MODEL):
+    """Request for step 1 (base JSON from PFAF only), or None when the PFAF text is unusable."""
     latin = entry.get("latin_name", "").strip()
     text_pfaf = entry.get("textpfaf", "").strip()
-    text_webmd = entry.get("textwebmd", "").strip()
-    text_herbpathy = entry.get("textherbpathy", "").strip()
 
-    if not text_pfaf or "error" in text_pfaf.lower() or "not found" in text_pfaf.lower():
+    if not pfaf_text_usable(entry):
         logger.warning(f"Skipping {latin} — invalid or missing PFAF content.")
         logger.debug(text_pfaf)
         return None
 
-    # --- STEP 1: Generate base JSON from PFAF only ---
+    condensed, before, after = condense.condense_sources({"PFAF": text_pfaf}, PFAF_TOKEN_BUDGET)
+    text_pfaf = condensed["PFAF"]
+
     prompt1 = f"""
 You are a herbal medicine expert AI.  
 Using ONLY this PFAF data, fill out the JSON below.  
@@ -121,54 +144,49 @@ PFAF:
 {text_pfaf}
 
 Return ONLY valid JSON in this structure:
-{{
-  "Herb": {{
-    "Name": "",
-    "LatinName": "{latin}",
-    "Description": "",
-    "Dosage": "",
-    "Tags": [],
-    "Sources": "",
-    "AilmentsTreated": [{{"Name": "","Description": ""}}],
-    "SideEffects": [{{"Name": "","Description": "","Severity": "mild"}}]
-  }},
-  "HerbPreparationSteps":[{{"StepName": "","Description": "","Duration": "","Temperature": "","Type": "","Order": 1}}],
-  "HerbWarnings":[{{"WarningTitle": "","Description": "","WarningType": "","Order": 1}}],
-  "ScientificStudies":[{{"StudyTitle": "","Summary": "","DOI": "","ExternalLink": ""}}],
-  "Tags":[{{"Name": ""}}]
-}}
+{json.dumps(build_template(latin), indent=2)}
 """
+    request = build_request(prompt1, temperature=0.2, model=model)
+    _prompt_savings[_prompt_hash(request)] = (latin, before, after)
+    return request
 
-    try:
-        response1 = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a helpful herbal medicine assistant."},
-                {"role": "user", "content": prompt1}
-            ],
-            temperature=0.2,
-            max_tokens=1000
-        )
 
-        result1 = response1.choices[0].message.content.strip().strip("```json").strip("```")
-        data = json.loads(result1)
+def fill_request(entry, data, model=MODEL):
+    """Request for step 2 (fill empty fields from WebMD/Herbpathy), or None when there is nothing to fill."""
+    text_webmd = entry.get("textwebmd", "").strip()
+    text_herbpathy = entry.get("textherbpathy", "").strip()
 
-    except Exception as e:
-        logger.error(f"Error in initial PFAF parsing for {latin}: {e}")
-        logger.debug("Raw GPT response:\n%s", result1)
+    empty_fields = find_empty_fields(data)
+    if not empty_fields or not (text_webmd or text_herbpathy):
         return None
 
-    # --- STEP 2: Check for empty fields ---
-    empty_fields = find_empty_fields(data)
+    condensed, before, after = condense.condense_sources(
+        {"WebMD": text_webmd, "Herbpathy": text_herbpathy},
+        FILL_TOKEN_BUDGET,
+        condense.keywords_for(empty_fields),
+    )
+    source_texts = ""
+    for name, text in condensed.items():
+        source_texts += f"\n--- {name} ---\n{text}"
+
+    if FILL_MODE == "delta":
+        herb_name = data.get("Herb", {}).get("Name") or entry.get("latin_name", "")
+        field_list = "\n".join(empty_fields)
+        prompt2 = f"""
+These fields are empty in the JSON for the herb {herb_name}:
+{field_list}
 
-    if empty_fields and (text_webmd or text_herbpathy):
-        logger.info(f"Filling missing fields from WebMD/Herbpathy")
-        source_texts = ""
-        if text_webmd:
-            source_texts += f"\n--- WebMD ---\n{text_webmd}"
-        if text_herbpathy:
-            source_texts += f"\n--- Herbpathy ---\n{text_herbpathy}"
+INSTRUCTIONS:
+1. First, try to extract information from the text below.
+2. If the text does NOT contain the information, use your own trusted and up-to-date herbal medicine knowledge.
+3. DO NOT leave any of the listed fields blank.
+4. Return ONLY a JSON object whose keys are exactly the field paths listed above and whose values fill them
+   (text, a number for Order fields, a list of strings for Herb.Tags).
 
+TEXT:
+{source_texts}
+"""
+    else:
         prompt2 = f"""
 Some fields are missing in this herb JSON: {", ".join(empty_fields)}.  
 Use the following text to fill ONLY those missing fields.
@@ -187,24 +205,183 @@ TEXT:
 Current JSON (fill missing fields only):
 {json.dumps(data, indent=2)}
 """
+    request = build_request(prompt2, temperature=0.3, model=model)
+    _prompt_savings[_prompt_hash(request)] = (entry.get("latin_name", ""), before, after)
+    return request
+
+
+def merge_fill(data, content):
+    """Apply the step-2 reply: the whole document in "full" mode, only the requested paths in "delta" mode."""
+    reply = parse_json_reply(content)
+    if FILL_MODE != "delta":
+        return reply
+
+    wanted = set(find_empty_fields(data))
+    merged = copy.deepcopy(data)
+    for path, value in reply.items():
+        if path in wanted:
+            set_path(merged, path, value)
+    return merged
+
+
+def record_usage(step, latin, usage, model=MODEL, seconds=None):
+    if usage is None:
+        return
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0, 0))
+    cost = (usage.prompt_tokens * prompt_price + usage.completion_tokens * completion_price) / 1e6
+    with _usage_lock:
+        totals = usage_totals.setdefault((step, model), Counter())
+        totals.update(calls=1, prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+        totals["cost"] += cost
+        if seconds is not None:
+            totals["timed_calls"] += 1
+            totals["seconds"] += seconds
+    metrics.inc("terrapura_gpt_calls_total", step=step, model=model)
+    metrics.inc("terrapura_gpt_tokens_total", usage.prompt_tokens, step=step, model=model, kind="prompt")
+    metrics.inc("terrapura_gpt_tokens_total", usage.completion_tokens, step=step, model=model, kind="completion")
+    metrics.inc("terrapura_gpt_cost_usd_total", cost, step=step, model=model)
+    if seconds is not None:
+        metrics.observe("terrapura_gpt_call_seconds", seconds, step=step, model=model)
+    logger.info(f"GPT {step} call ({model}) for {latin}: {usage.prompt_tokens} prompt + {usage.completion_tokens} completion tokens")
+
+
+def record_escalation(step, model, latin, reason):
+    with _usage_lock:
+        usage_totals.setdefault((step, model), Counter())["escalations"] += 1
+    metrics.inc("terrapura_gpt_escalations_total", step=step, model=model, reason=reason)
+    logger.info(f"GPT {step} reply from {model} for {latin} is not good enough ({reason}), asking the next tier.")
+
+
+metrics.describe("terrapura_gpt_cost_usd_total", "counter", "Estimated OpenAI spend in USD, by step and model (see MODEL_PRICES).")
+metrics.describe("terrapura_gpt_call_seconds", "histogram", "OpenAI call latency, by step and model.")
+metrics.describe("terrapura_gpt_escalations_total", "counter", "Replies that sent a step to the next model tier, by the tier that fell short.")
+
+
+def usage_summary():
+    lines = []
+    for (step, model), totals in sorted(usage_totals.items()):
+        calls = totals["calls"] or 1
+        latency = f", {totals['seconds'] / totals['timed_calls']:.1f}s avg" if totals["timed_calls"] else ""
+        lines.append(
+            f"{step}/{model}: {totals['calls']} calls, {totals['escalations']} escalated ({totals['escalations'] / calls:.0%}), "
+            f"{totals['prompt_tokens']} prompt / {totals['completion_tokens']} completion tokens"
+            f" (avg {totals['prompt_tokens'] // calls} / {totals['completion_tokens'] // calls}){latency}, ${totals['cost']:.2f}"
+        )
+    body = "\n  ".join(lines) if lines else "no calls"
+    return f"GPT usage —\n  {body}\n" + condense.summary()
+
+
+def cache_reply(request, content, keep_invalid=False):
+    """Cache a reply under its request. Invalid JSON is only kept with `keep_invalid` (batch mode,
+    where the cached reply is how the cascade learns the tier fell short)."""
+    try:
+        parse_json_reply(content)
+    except ValueError:
+        if not keep_invalid:
+            return  # don't pin an unusable reply in the cache
+    get_response_cache().put(request, content)
+
+
+def complete(request, step="", latin=""):
+    cached = get_response_cache().get(request)
+    if cached is not None:
+        logger.info(f"GPT {step} call for {latin}: cache hit")
+        metrics.inc("terrapura_gpt_cache_hits_total", step=step)
+        return cached
+    record_sent(request)
+    start = time.perf_counter()
+    response = get_client().chat.completions.create(**request)
+    record_usage(step, latin, response.usage, request["model"], time.perf_counter() - start)
+    content = response.choices[0].message.content
+    cache_reply(request, content)
+    return content
+
+
+def pfaf_shortfall(data):
+    """Why a step-1 reply should go to the next tier, or None if it will do."""
+    empty = set(find_empty_fields(data))
+    missing = [path for path in PFAF_REQUIRED_FIELDS if path in empty]
+    return f"empty {', '.join(missing)}" if missing else None
+
+
+def extraction_steps(entry, on_escalation=record_escalation):
+    """The two-step extraction of one herb, up the model tiers, as a generator.
+
+    It yields (step, request) for every call it needs and is sent the reply content; a failed call
+    is thrown into it instead. It returns the extracted JSON (None if step 1 failed), which the
+    sync, async and batch runners all get from StopIteration. `on_escalation(step, model, latin,
+    reason)` is called whenever a reply sends a step to the next tier.
+    """
+    latin = entry.get("latin_name", "").strip()
+
+    # --- STEP 1: Generate base JSON from PFAF only ---
+    request1 = pfaf_request(entry)
+    if request1 is None:
+        return None
 
+    data = None
+    for tier, model in enumerate(MODEL_TIERS):
+        try:
+            result1 = yield "pfaf", dict(request1, model=model)
+        except Exception as e:
+            logger.error(f"Error in initial PFAF parsing for {latin}: {e}")
+            break
         try:
-            response2 = client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a helpful herbal medicine assistant."},
-                    {"role": "user", "content": prompt2}
-                ],
-                temperature=0.3,
-                max_tokens=1000
-            )
-
-            result2 = response2.choices[0].message.content.strip().strip("```json").strip("```")
-            data = json.loads(result2)
+            parsed = parse_json_reply(result1)
+        except Exception as e:
+            logger.error(f"Error in initial PFAF parsing for {latin} ({model}): {e}")
+            logger.debug("Raw GPT response:\n%s", result1)
+            reason = "invalid JSON"
+        else:
+            data = parsed
+            reason = pfaf_shortfall(data)
+        if not reason:
+            break
+        if tier + 1 < len(MODEL_TIERS):
+            on_escalation("pfaf", model, latin, reason)
+
+    if data is None:
+        return None
+
+    # --- STEP 2: Fill empty fields from WebMD/Herbpathy ---
+    for tier, model in enumerate(MODEL_TIERS):
+        request2 = fill_request(entry, data, model)
+        if request2 is None:
+            break
 
+        if tier == 0:
+            logger.info(f"Filling missing fields from WebMD/Herbpathy")
+        try:
+            result2 = yield "fill", request2
         except Exception as e:
             logger.error(f"Error filling missing fields for {latin}: {e}")
-            logger.debug("Raw GPT response:\n%s", result2)
             return data  # Return partial result anyway
+        try:
+            data = merge_fill(data, result2)
+            reason = "fields still empty" if find_empty_fields(data) else None
+        except Exception as e:
+            logger.error(f"Error filling missing fields for {latin} ({model}): {e}")
+            logger.debug("Raw GPT response:\n%s", result2)
+            reason = "invalid JSON"
+        if not reason:
+            break
+        if tier + 1 < len(MODEL_TIERS):
+            on_escalation("fill", model, latin, reason)
 
     return data
+
+
+def extract_herb_info_with_gpt(entry):
+    latin = entry.get("latin_name", "").strip()
+    steps = extraction_steps(entry)
+    try:
+        step, request = next(steps)
+        while True:
+            try:
+                content = complete(request, step, latin)
+            except Exception as e:
+                step, request = steps.throw(e)
+            else:
+                step, request = steps.send(content)
+    except StopIteration as done:
+        return done.value
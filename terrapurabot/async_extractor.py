@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+
+import openai
+
+from ai_extractor import (
+    cache_reply,
+    extraction_steps,
+    get_response_cache,
+    load_env,
+    record_sent,
+    record_usage,
+    usage_summary,
+)
+from dedup import fingerprint
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+
+
+def estimate_request_tokens(request):
+    # Rough count (~4 chars per token) plus the completion budget; corrected with real usage afterwards.
+    prompt_chars = sum(len(m["content"]) for m in request["messages"])
+    return prompt_chars // 4 + request.get("max_tokens", 0)
+
+
+class TokenBucket:
+    """Refills at `per_minute` units per minute, up to `per_minute` units of burst."""
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        # Waiters queue on the lock, so the bucket is handed out in arrival order.
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+    def adjust(self, amount):
+        """Give back (positive) or charge extra (negative) once the real usage is known."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class AsyncExtractor:
+    def __init__(self, client=None, concurrency=8, rpm=500, tpm=80000, max_retries=6, base_delay=1.0, max_delay=60.0, duplicates=None):
+        # Retries are handled here so they respect the rate limiter; the SDK's own retries are turned off.
+        if client is None:
+            load_env()
+            client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+        self.client = client
+        self.concurrency = concurrency
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # A dedup.DuplicateIndex: herbs whose sources match an extracted herb reuse its extraction.
+        self.duplicates = duplicates
+
+    def _backoff(self, attempt, error):
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return float(retry_after) + random.uniform(0, self.base_delay)
+            except ValueError:
+                pass
+        # Full jitter: spreads retries out so workers that failed together don't retry together.
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def complete(self, request, step="", latin=""):
+        cached = get_response_cache().get(request)
+        if cached is not None:
+            logger.info(f"GPT {step} call for {latin}: cache hit")
+            metrics.inc("terrapura_gpt_cache_hits_total", step=step)
+            return cached
+
+        record_sent(request)
+        estimate = estimate_request_tokens(request)
+        for attempt in range(self.max_retries + 1):
+            await self.requests.acquire()
+            await self.tokens.acquire(estimate)
+            try:
+                async with self.semaphore:
+                    start = time.perf_counter()
+                    response = await self.client.chat.completions.create(**request)
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                metrics.inc("terrapura_gpt_retries_total", error=type(e).__name__)
+                logger.warning(f"{type(e).__name__} from OpenAI, retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+                await asyncio.sleep(delay)
+                continue
+
+            if response.usage:
+                self.tokens.adjust(estimate - response.usage.total_tokens)
+            record_usage(step, latin, response.usage, request["model"], time.perf_counter() - start)
+            content = response.choices[0].message.content
+            cache_reply(request, content)
+            return content
+
+    async def extract(self, entry):
+        """Async twin of ai_extractor.extract_herb_info_with_gpt."""
+        latin = entry.get("latin_name", "").strip()
+        steps = extraction_steps(entry)
+        try:
+            step, request = next(steps)
+            while True:
+                try:
+                    content = await self.complete(request, step, latin)
+                except Exception as e:
+                    step, request = steps.throw(e)
+                else:
+                    step, request = steps.send(content)
+        except StopIteration as done:
+            return done.value
+
+    async def extract_or_reuse(self, entry):
+        """(herb, store updates), as scrapper.extract_or_reuse; (None, None) on failure."""
+        latin = entry["latin_name"]
+        fp = fingerprint(entry) if self.duplicates is not None else None
+        reused = self.duplicates.reuse(latin, fp) if fp else None
+        if reused:
+            return reused
+
+        data = await self.extract(entry)
+        if not data:
+            return None, None
+        updates = {"extracted": True}
+        if fp:
+            self.duplicates.add(latin, fp, data)
+            updates["fingerprint"] = fp
+        return data, updates
+
+    async def _worker(self, queue, on_result):
+        while True:
+            entry = await queue.get()
+            try:
+                if entry is None:
+                    return
+                data, updates = await self.extract_or_reuse(entry)
+                if data:
+                    on_result(entry["latin_name"], data, updates)
+            except Exception as e:
+                logger.error(f"Extraction failed for {entry.get('latin_name')}: {e}")
+            finally:
+                queue.task_done()
+
+    async def run(self, entries, on_result):
+        """Extract every entry from the iterable, calling `on_result(latin_name, data, updates)` for each success."""
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        workers = [asyncio.create_task(self._worker(queue, on_result)) for _ in range(self.concurrency)]
+        for entry in entries:
+            await queue.put(dict(entry))
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+
+def pending_entries(store):
+    for entry in store.records:
+        if all(k in entry for k in ["textwebmd", "textherbpathy", "textpfaf"]) and not entry.get("extracted"):
+            yield entry
+
+
+def main(argv=None):
+    from metrics import ProgressReporter
+    from scrapper import (
+        DEDUP_SOURCES,
+        METRICS_FILE,
+        METRICS_INTERVAL,
+        duplicates,
+        open_data_stores,
+        save_result,
+    )
+
+    parser = argparse.ArgumentParser(description="Run GPT extraction for every fully scraped herb.")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight at once")
+    parser.add_argument("--rpm", type=int, default=500, help="requests per minute")
+    parser.add_argument("--tpm", type=int, default=80000, help="tokens per minute")
+    parser.add_argument("--base-url", default=os.getenv("OPENAI_BASE_URL"), help="OpenAI-compatible endpoint, e.g. a local stub")
+    args = parser.parse_args(argv)
+
+    stores = open_data_stores()
+    if stores is None:
+        return
+    store, sink = stores
+
+    load_env()
+    client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=args.base_url, max_retries=0)
+    extractor = AsyncExtractor(client, concurrency=args.concurrency, rpm=args.rpm, tpm=args.tpm,
+                               duplicates=duplicates if DEDUP_SOURCES else None)
+
+    def on_result(latin_name, data, updates):
+        save_result(store, sink, latin_name, updates, data)
+        metrics.inc("terrapura_herbs_done_total")
+        logger.info(f"GPT extraction saved for {latin_name}.")
+
+    entries = list(pending_entries(store))
+    metrics.set("terrapura_herbs_planned", len(entries))
+    reporter = ProgressReporter(interval=METRICS_INTERVAL, textfile=METRICS_FILE)
+    reporter.start()
+    try:
+        asyncio.run(extractor.run(entries, on_result))
+    finally:
+        sink.close()
+        store.close()
+        reporter.close()
+        logger.info(get_response_cache().summary())
+        logger.info(usage_summary())
+
+
+if __name__ == "__main__":
+    main()
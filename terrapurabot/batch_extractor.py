@@ -0,0 +1,226 @@
+import argparse
+import json
+import logging
+import os
+from types import SimpleNamespace
+
+from ai_extractor import (
+    cache_reply,
+    extraction_steps,
+    get_client,
+    get_response_cache,
+    parse_json_reply,
+    record_escalation,
+    record_sent,
+    record_usage,
+    usage_summary,
+)
+from async_extractor import pending_entries
+from dedup import fingerprint
+from gpt_cache import request_key
+
+logger = logging.getLogger(__name__)
+
+BATCH_REQUESTS_FILE = "batch_requests.jsonl"
+BATCH_RESULTS_FILE = "batch_results.jsonl"
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+
+def custom_id(step, request, latin):
+    # The request hash ties a result to the exact prompt it answers; the rest is for people reading the file.
+    return f"{step}:{request_key(request)[:16]}:{latin}"
+
+
+def next_step(entry, fresh=frozenset()):
+    """Where a herb's extraction stands, going by cached replies only.
+
+    ("pfaf" or "fill", request) for the call it still needs, or (None, data) once every reply it
+    needs is cached (data is None when the herb cannot be extracted). The walk is repeated on every
+    `write` and `ingest`, so escalations are only counted for replies whose request key is in `fresh`
+    (the ones ingested just now).
+    """
+    sent = [None]
+
+    def on_escalation(*args):
+        if sent[0] in fresh:
+            record_escalation(*args)
+
+    steps = extraction_steps(entry, on_escalation)
+    try:
+        step, request = next(steps)
+        while True:
+            content = get_response_cache().get(request)
+            if content is None:
+                return step, request
+            sent[0] = request_key(request)
+            step, request = steps.send(content)
+    except StopIteration as done:
+        return None, done.value
+
+
+def write_batch(entries, path=BATCH_REQUESTS_FILE):
+    """Write the next request of every entry that still needs one; returns {step: count}."""
+    counts = {"pfaf": 0, "fill": 0}
+    seen = set()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for entry in entries:
+            latin = entry["latin_name"]
+            step, request = next_step(entry)
+            if step is None:
+                continue
+            line_id = custom_id(step, request, latin)
+            if line_id in seen:
+                continue
+            seen.add(line_id)
+            f.write(json.dumps({"custom_id": line_id, "method": "POST", "url": BATCH_ENDPOINT, "body": request}, ensure_ascii=False) + "\n")
+            record_sent(request)
+            counts[step] += 1
+    os.replace(tmp_path, path)
+    return counts
+
+
+def _read_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for raw in f:
+            if raw.strip():
+                yield json.loads(raw)
+
+
+def ingest_results(requests_path, results_path):
+    """Cache every reply in a results file against the request it answers.
+
+    Replies go into the GPT response cache keyed by request, so ingesting the same file twice
+    changes nothing. Invalid JSON is cached too: the next `write` then asks the next model tier,
+    as the live runners do, instead of asking the same tier forever. Returns (ingested, failed,
+    request keys ingested).
+    """
+    requests = {line["custom_id"]: line["body"] for line in _read_jsonl(requests_path)}
+    ingested = failed = 0
+    fresh = set()
+    for line in _read_jsonl(results_path):
+        request = requests.get(line.get("custom_id"))
+        response = line.get("response") or {}
+        if request is None:
+            logger.warning(f"Result {line.get('custom_id')} does not match any request in {requests_path}, skipping.")
+            failed += 1
+            continue
+        if line.get("error") or response.get("status_code") != 200:
+            logger.warning(f"Batch request {line['custom_id']} failed: {line.get('error') or response.get('status_code')}")
+            failed += 1
+            continue
+
+        body = response["body"]
+        step, _, latin = line["custom_id"].split(":", 2)
+        if body.get("usage"):
+            record_usage(step, latin, SimpleNamespace(**body["usage"]), request["model"])
+        content = body["choices"][0]["message"]["content"]
+        try:
+            parse_json_reply(content)
+        except ValueError:
+            logger.warning(f"Batch reply for {latin} ({step}, {request['model']}) is not valid JSON, the next tier will be asked.")
+        cache_reply(request, content, keep_invalid=True)
+        fresh.add(request_key(request))
+        ingested += 1
+    return ingested, failed, fresh
+
+
+def finish(entries, on_result, fresh=frozenset()):
+    """Hand every entry whose replies are all cached to `on_result(latin_name, data)`; returns how many."""
+    done = 0
+    for entry in entries:
+        try:
+            step, data = next_step(entry, fresh)
+        except Exception as e:
+            logger.error(f"Could not assemble the extraction for {entry['latin_name']}: {e}")
+            continue
+        if step is None and data:
+            on_result(entry["latin_name"], data)
+            done += 1
+    return done
+
+
+def submit_batch(path=BATCH_REQUESTS_FILE):
+    client = get_client()
+    with open(path, "rb") as f:
+        uploaded = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(input_file_id=uploaded.id, endpoint=BATCH_ENDPOINT, completion_window="24h")
+    logger.info(f"Submitted {path} as batch {batch.id} ({batch.status}).")
+    return batch.id
+
+
+def download_batch(batch_id, path=BATCH_RESULTS_FILE):
+    """Save a finished batch's results (and its per-request errors) to `path`; False if it is not done yet."""
+    client = get_client()
+    batch = client.batches.retrieve(batch_id)
+    if batch.status != "completed":
+        logger.info(f"Batch {batch_id} is {batch.status}.")
+        return False
+    with open(path, "w", encoding="utf-8") as f:
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                f.write(client.files.content(file_id).text)
+    logger.info(f"Batch {batch_id} results saved to {path}.")
+    return True
+
+
+def main(argv=None):
+    from scrapper import DEDUP_SOURCES, duplicates, open_data_stores, save_result
+
+    parser = argparse.ArgumentParser(description="Run GPT extraction through batch files instead of live calls.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    write = commands.add_parser("write", help="write the next request of every pending herb to a batch file")
+    write.add_argument("--requests", default=BATCH_REQUESTS_FILE)
+    ingest = commands.add_parser("ingest", help="load a results file, then save every herb whose replies are all in")
+    ingest.add_argument("--requests", default=BATCH_REQUESTS_FILE)
+    ingest.add_argument("--results", default=BATCH_RESULTS_FILE)
+    submit = commands.add_parser("submit", help="upload a batch file to the OpenAI Batch API")
+    submit.add_argument("--requests", default=BATCH_REQUESTS_FILE)
+    download = commands.add_parser("download", help="fetch the results of a submitted batch")
+    download.add_argument("batch_id")
+    download.add_argument("--results", default=BATCH_RESULTS_FILE)
+    args = parser.parse_args(argv)
+
+    if args.command == "submit":
+        submit_batch(args.requests)
+        return
+    if args.command == "download":
+        download_batch(args.batch_id, args.results)
+        return
+
+    if get_response_cache().bypass:
+        logger.warning("GPT_CACHE_BYPASS is set, but batch mode keeps replies in the cache; ignoring it.")
+        get_response_cache().bypass = False
+
+    stores = open_data_stores()
+    if stores is None:
+        return
+    store, sink = stores
+    try:
+        if args.command == "write":
+            entries = []
+            for entry in list(pending_entries(store)):
+                reused = duplicates.reuse(entry["latin_name"], fingerprint(entry)) if DEDUP_SOURCES else None
+                if reused:
+                    save_result(store, sink, entry["latin_name"], reused[1], reused[0])
+                else:
+                    entries.append(entry)
+            counts = write_batch(entries, args.requests)
+            logger.info(f"Wrote {counts['pfaf']} PFAF and {counts['fill']} fill-in requests to {args.requests}.")
+        else:
+            ingested, failed, fresh = ingest_results(args.requests, args.results)
+
+            def on_result(latin_name, data):
+                save_result(store, sink, latin_name, {"extracted": True}, data)
+
+            done = finish(list(pending_entries(store)), on_result, fresh)
+            logger.info(f"Ingested {ingested} replies ({failed} failed); {done} herbs fully extracted. "
+                        f"Run `write` again for the herbs that still need a call.")
+    finally:
+        sink.close()
+        store.close()
+        logger.info(usage_summary())
+
+
+if __name__ == "__main__":
+    main()
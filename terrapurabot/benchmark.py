@@ -0,0 +1,164 @@
+import argparse
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from fake_openai import FakeOpenAI
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(HERE, "bench_fixtures")
+BASELINE_FILE = os.path.join(HERE, "bench_baseline.json")
+
+
+def load_pages(archive_dir=None, limit=50):
+    """Pages to benchmark on: real captures from the HTML archive when given, else the bundled fixtures."""
+    if archive_dir:
+        from html_archive import HtmlArchive
+        archive = HtmlArchive(archive_dir)
+        herbs = defaultdict(dict)
+        for (latin_name, kind), capture in archive.latest().items():
+            herbs[latin_name][kind] = archive.load(capture["sha256"])
+        pages = [
+            {"latin_name": name, "webmd": kinds["webmd_monograph"], "herbpathy": kinds["herbpathy"], "pfaf": kinds["pfaf"]}
+            for name, kinds in herbs.items()
+            if {"webmd_monograph", "herbpathy", "pfaf"} <= kinds.keys()
+        ]
+        if pages:
+            return pages[:limit]
+        logging.warning(f"No complete herbs in {archive_dir}, using bundled fixtures.")
+
+    fixture = {}
+    for kind in ("webmd", "herbpathy", "pfaf"):
+        with open(os.path.join(FIXTURES_DIR, f"{kind}.html"), "r", encoding="utf-8") as f:
+            fixture[kind] = f.read()
+    return [dict(fixture, latin_name=f"Plantago major {i}") for i in range(limit)]
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else 0.0
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KB on Linux
+
+
+def run(pages, latency, rate_limit):
+    server = FakeOpenAI(latency=latency, rate_limit_ratio=rate_limit).start()
+    # Point ai_extractor's client (created on first use) at the fake server and keep the benchmark's
+    # cache out of the real one.
+    os.environ["OPENAI_BASE_URL"] = server.url
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    workdir = tempfile.mkdtemp(prefix="terrapura-bench-")
+
+    import ai_extractor
+    from gpt_cache import ResponseCache
+    from herb_schema import find_empty_fields
+    from scrapper import PFAF_FIELD_IDS, parse_herbpathy_html, parse_pfaf_html, parse_webmd_html
+
+    ai_extractor.response_cache = ResponseCache(os.path.join(workdir, "cache.sqlite"), bypass=True)
+    logging.disable(logging.INFO)
+
+    samples = defaultdict(list)
+
+    def timed(stage, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        samples[stage].append(time.perf_counter() - start)
+        return result
+
+    started = time.perf_counter()
+    extracted = 0
+    for page in pages:
+        entry = {"latin_name": page["latin_name"]}
+        entry["textwebmd"] = timed("webmd_parse", parse_webmd_html, page["webmd"])
+        entry["textherbpathy"] = timed("herbpathy_parse", parse_herbpathy_html, page["herbpathy"])
+        texts = timed("pfaf_parse", parse_pfaf_html, page["pfaf"]) or [""] * len(PFAF_FIELD_IDS)
+        entry["textpfaf"] = "\n\n".join(texts)
+        data = timed("extract_herb_info_with_gpt", ai_extractor.extract_herb_info_with_gpt, entry)
+        if data:
+            extracted += 1
+            timed("find_empty_fields", find_empty_fields, data)
+    elapsed = time.perf_counter() - started
+    server.stop()
+
+    return {
+        "herbs": len(pages),
+        "extracted": extracted,
+        "elapsed_s": round(elapsed, 3),
+        "herbs_per_min": round(len(pages) / elapsed * 60, 1) if elapsed else 0.0,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "gpt_requests": server.requests,
+        "gpt_429s": server.rate_limited,
+        "stages_ms": {
+            stage: {
+                "p50": round(percentile(times, 0.5) * 1000, 2),
+                "p95": round(percentile(times, 0.95) * 1000, 2),
+                "mean": round(sum(times) / len(times) * 1000, 2),
+            }
+            for stage, times in samples.items()
+        },
+    }
+
+
+def print_report(report):
+    print(f"{report['herbs']} herbs in {report['elapsed_s']}s -> {report['herbs_per_min']} herbs/min, "
+          f"peak RSS {report['peak_rss_mb']} MB, {report['gpt_requests']} GPT requests ({report['gpt_429s']} got 429)")
+    print(f"{'stage':<30}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+    for stage, stats in report["stages_ms"].items():
+        print(f"{stage:<30}{stats['p50']:>10}{stats['p95']:>10}{stats['mean']:>10}")
+
+
+def check_baseline(report, baseline, tolerance):
+    """Regressions beyond `tolerance` (a fraction) against a saved report."""
+    problems = []
+    if report["herbs_per_min"] < baseline["herbs_per_min"] * (1 - tolerance):
+        problems.append(f"throughput {report['herbs_per_min']} herbs/min vs baseline {baseline['herbs_per_min']}")
+    for stage, stats in report["stages_ms"].items():
+        old = baseline.get("stages_ms", {}).get(stage)
+        if old and stats["p50"] > old["p50"] * (1 + tolerance):
+            problems.append(f"{stage} p50 {stats['p50']} ms vs baseline {old['p50']} ms")
+    if report["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + tolerance):
+        problems.append(f"peak RSS {report['peak_rss_mb']} MB vs baseline {baseline['peak_rss_mb']} MB")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of parsing and GPT extraction throughput.")
+    parser.add_argument("--herbs", type=int, default=50, help="how many herbs to run")
+    parser.add_argument("--archive", help="benchmark on pages from this html_archive directory instead of the fixtures")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake OpenAI latency per call, seconds")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of fake OpenAI calls answered with 429")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--save-baseline", action="store_true", help=f"store this run as {os.path.basename(BASELINE_FILE)}")
+    parser.add_argument("--check-baseline", action="store_true", help="exit 1 if this run regressed against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression before --check-baseline fails")
+    args = parser.parse_args()
+
+    archive = os.path.abspath(args.archive) if args.archive else None
+    report = run(load_pages(archive, args.herbs), args.latency, args.rate_limit)
+    print_report(report)
+
+    if args.json:
+        with open(os.path.join(HERE, args.json) if not os.path.isabs(args.json) else args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.check_baseline:
+        with open(BASELINE_FILE, "r", encoding="utf-8") as f:
+            problems = check_baseline(report, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import argparse
+import json
+import os
+import sys
+
+# Only the modules a command needs are imported, inside that command, so light commands like
+# `status` never load Selenium, Chrome or the OpenAI client.
+
+
+def cmd_links(args):
+    import get_all_link
+    get_all_link.main()
+
+
+def cmd_scrape(args):
+    import scrapper
+    if args.pool:
+        scrapper.POOL_WORKERS = args.pool
+    if args.pipeline:
+        scrapper.PIPELINE_MODE = True
+    if args.no_extract:
+        scrapper.EXTRACT_INLINE = False
+    if scrapper.EXTRACT_INLINE and not args.replay:
+        from ai_extractor import get_client
+        try:
+            get_client()  # fail now, not on the first herb, if there is no API key
+        except RuntimeError as e:
+            sys.exit(f"error: {e}")
+    scrapper.main(replay=args.replay, refresh=args.refresh, shard=args.shard)
+
+
+def cmd_extract(args):
+    if args.extra[:1] == ["batch"]:
+        import batch_extractor
+        batch_extractor.main(args.extra[1:])
+    else:
+        import async_extractor
+        async_extractor.main(args.extra)
+
+
+def cmd_status(args):
+    from extracted_sink import ExtractedSink
+    from record_store import RecordStore
+    from config import AI_EXTRACTED_FILE, FETCH_FAILURES, PLANT_ALL_LINK, SCRAPED_COMBINED, SOURCE_FIELDS, WORK_QUEUE_FILE
+    from ai_extractor import CACHE_FILE
+    from work_queue import WorkQueue
+
+    try:
+        with open(PLANT_ALL_LINK, "r", encoding="utf-8") as f:
+            plants = len(json.load(f))
+    except (FileNotFoundError, json.JSONDecodeError):
+        plants = 0
+    store = RecordStore(SCRAPED_COMBINED, read_only=True)
+    sink = ExtractedSink(AI_EXTRACTED_FILE, read_only=True)
+
+    print(f"Plants in {PLANT_ALL_LINK}: {plants}")
+    print(f"Records in {SCRAPED_COMBINED}: {len(store.records)}")
+    for site, field in SOURCE_FIELDS.items():
+        values = [entry.get(field) for entry in store.records]
+        failed = sum(1 for value in values if value in FETCH_FAILURES)
+        fetched = sum(1 for value in values if value is not None) - failed
+        print(f"  {site:<10} fetched {fetched:>6}  failed {failed:>6}  not tried {values.count(None):>6}")
+
+    scraped = [e for e in store.records if all(field in e for field in SOURCE_FIELDS.values())]
+    extracted = [e for e in scraped if e.get("extracted")]
+    reused = sum(1 for e in extracted if e.get("duplicate_of"))
+    print(f"Fully scraped: {len(scraped)}, extracted: {len(extracted)} ({reused} reused from duplicates), "
+          f"waiting for extraction: {len(scraped) - len(extracted)}")
+    print(f"Herbs in {sink.log_path}: {len(sink.records)}")
+    if os.path.exists(WORK_QUEUE_FILE):
+        queue = WorkQueue(WORK_QUEUE_FILE)
+        counts, workers = queue.counts(), queue.active_workers()
+        queue.close()
+        print(f"Work queue {WORK_QUEUE_FILE}: " + ", ".join(f"{state} {n}" for state, n in sorted(counts.items())) +
+              f"; workers holding leases: {', '.join(workers) or 'none'}")
+    if os.path.exists(CACHE_FILE):
+        print(f"GPT reply cache: {os.path.getsize(CACHE_FILE) / 1024 / 1024:.1f} MB")
+
+
+def cmd_export(args):
+    from herb_export import EXPORT_DB, EXPORT_PARQUET_DIR, HerbExporter, sink_herbs
+    from scrapper import AI_EXTRACTED_FILE, SCRAPED_COMBINED, open_data_stores
+
+    # Fold the journals (including every shard worker's) back into the JSON files.
+    stores = open_data_stores(prepare=False)
+    if stores is None:
+        sys.exit(1)
+    store, sink = stores
+    store.close()
+    sink.close()
+    print(f"Wrote {SCRAPED_COMBINED} and {AI_EXTRACTED_FILE} ({len(sink.records)} herbs).")
+
+    db = args.db or EXPORT_DB
+    parquet_dir = EXPORT_PARQUET_DIR if args.parquet is True else args.parquet
+    exporter = HerbExporter(db)
+    try:
+        written, unchanged, removed = exporter.export(sink_herbs(sink), full=args.full)
+        print(f"{db}: {written} herbs written, {unchanged} unchanged, {removed} removed.")
+        if parquet_dir and exporter.write_parquet(parquet_dir):
+            print(f"Parquet files written to {parquet_dir}/.")
+    finally:
+        exporter.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="terrapurabot", description="Scrape herb sources and extract structured herb data.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("links", help="harvest every plant link from PFAF").set_defaults(run=cmd_links)
+
+    scrape = commands.add_parser("scrape", help="fetch WebMD, Herbpathy and PFAF text for every plant")
+    scrape.add_argument("--replay", action="store_true", help="re-parse archived pages instead of scraping (no network)")
+    scrape.add_argument("--refresh", action="store_true", help="re-check already scraped sources and re-extract herbs whose text changed")
+    scrape.add_argument("--shard", action="store_true", help="split the plants with other scrapper processes through the shared work queue")
+    scrape.add_argument("--pool", type=int, metavar="N", help="run N Chrome drivers side by side")
+    scrape.add_argument("--pipeline", action="store_true", help="run fetching and extraction as overlapping stages")
+    scrape.add_argument("--no-extract", action="store_true", help="only scrape; leave GPT extraction to `extract`")
+    scrape.set_defaults(run=cmd_scrape)
+
+    extract = commands.add_parser(
+        "extract", help="GPT extraction of every scraped herb (async; `extract batch ...` for batch files)",
+        # Options, --help included, are passed on to async_extractor.py, or to batch_extractor.py after `batch`.
+        add_help=False,
+    )
+    extract.set_defaults(run=cmd_extract)
+
+    commands.add_parser("status", help="show progress without touching any file").set_defaults(run=cmd_status)
+    export = commands.add_parser("export", help="write the JSON output files and the SQLite (and Parquet) export")
+    export.add_argument("--db", help="SQLite file for the normalized export (default herbs.sqlite)")
+    export.add_argument("--parquet", nargs="?", const=True, metavar="DIR", help="also write Parquet files (needs pyarrow; default dir herbs_parquet)")
+    export.add_argument("--full", action="store_true", help="rewrite every herb in the SQLite export, not only the changed ones")
+    export.set_defaults(run=cmd_export)
+
+    # Whatever `extract` does not know is left for async_extractor.py / batch_extractor.py to parse.
+    args, args.extra = parser.parse_known_args(argv)
+    if args.extra and args.run is not cmd_extract:
+        parser.error(f"unrecognized arguments: {' '.join(args.extra)}")
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
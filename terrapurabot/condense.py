@@ -0,0 +1,143 @@
+import logging
+import re
+import threading
+from collections import Counter
+
+try:
+    import tiktoken
+except ImportError:  # fall back to a ~4 characters per token estimate
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Keywords that mark a paragraph as useful for a part of the herb schema.
+FIELD_KEYWORDS = {
+    "Herb.Description": ["perennial", "annual", "shrub", "tree", "herb", "native", "grows", "leaves", "flowers"],
+    "Herb.Dosage": ["dose", "dosage", "mg", "gram", "daily", "times a day", "cup", "taken"],
+    "Herb.AilmentsTreated": ["used for", "used to", "treat", "remedy", "medicinal", "relief", "disorder", "infection", "pain"],
+    "Herb.SideEffects": ["side effect", "adverse", "nausea", "vomit", "diarrh", "allerg", "irritat", "upset"],
+    "HerbWarnings": ["warning", "pregnan", "breast-feed", "breastfeed", "avoid", "caution", "interact", "hazard", "toxic", "children", "surgery", "unsafe"],
+    "HerbPreparationSteps": ["prepar", "infusion", "decoction", "tincture", "poultice", "boil", "steep", "dried", "harvest", "tea"],
+    "ScientificStudies": ["study", "studies", "research", "trial", "evidence", "clinical"],
+}
+ALL_KEYWORDS = sorted({k for words in FIELD_KEYWORDS.values() for k in words})
+
+# Lines that show up on every page of a site and never help the extraction.
+BOILERPLATE = re.compile(
+    r"^(show sources|sources:?|references:?|read more|advertisement|print|share|"
+    r"copyright .*|© .*|this copyrighted material is provided by .*|"
+    r"disclaimer.*|last reviewed .*|medically reviewed .*|"
+    r"\[\d+(,\s*\d+)*\]|for a list of reference codes used.*)$",
+    re.IGNORECASE,
+)
+
+savings = Counter()
+_savings_lock = threading.Lock()
+_encoding = None
+
+
+def count_tokens(text):
+    global _encoding
+    if tiktoken is None:
+        return len(text) // 4 + 1
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def keywords_for(paths):
+    """Keywords relevant to the given schema paths (e.g. the empty fields step 2 has to fill)."""
+    words = set()
+    for path in paths:
+        for prefix, keywords in FIELD_KEYWORDS.items():
+            if path.startswith(prefix):
+                words.update(keywords)
+    return sorted(words) or ALL_KEYWORDS
+
+
+def dedupe_paragraphs(text, seen=None):
+    """Drop boilerplate lines and any paragraph already seen (in this text or, via `seen`, in another source)."""
+    seen = set() if seen is None else seen
+    kept = []
+    for paragraph in re.split(r"\n\s*\n|\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph or BOILERPLATE.match(paragraph):
+            continue
+        key = re.sub(r"\W+", " ", paragraph.lower()).strip()
+        if key in seen:
+            continue
+        seen.add(key)
+        kept.append(paragraph)
+    return kept
+
+
+def _select(paragraphs, budget, keywords):
+    """Keep the most relevant paragraphs that fit the budget, in their original order."""
+    scored = []
+    for i, paragraph in enumerate(paragraphs):
+        lower = paragraph.lower()
+        hits = sum(lower.count(k) for k in keywords)
+        tokens = count_tokens(paragraph)
+        # Hits per token favours dense, on-topic paragraphs; the opening paragraph usually describes the plant.
+        score = hits / tokens + (1 if i == 0 else 0)
+        scored.append((score, i, tokens))
+
+    chosen = []
+    used = 0
+    for score, i, tokens in sorted(scored, key=lambda s: (-s[0], s[1])):
+        if used + tokens > budget:
+            continue
+        chosen.append(i)
+        used += tokens
+    if not chosen and scored:
+        # Even the best paragraph is over budget on its own: keep the start of it.
+        best = max(scored, key=lambda s: (s[0], -s[1]))[1]
+        return [paragraphs[best][: budget * 4]]
+    return [paragraphs[i] for i in sorted(chosen)]
+
+
+def condense(text, budget, keywords=ALL_KEYWORDS, seen=None):
+    """Deduplicated text, cut down to the paragraphs most relevant to `keywords` if it is over `budget` tokens."""
+    paragraphs = dedupe_paragraphs(text, seen)
+    if count_tokens("\n".join(paragraphs)) > budget:
+        paragraphs = _select(paragraphs, budget, keywords)
+    return "\n".join(paragraphs)
+
+
+def condense_sources(sources, budget, keywords=ALL_KEYWORDS):
+    """Condense several named source texts into one shared budget; returns (condensed, tokens before, tokens after).
+
+    Short sources keep everything they have and the long ones split what is left of the budget
+    evenly. Paragraphs repeated across sources are only kept once. Nothing is counted here: a
+    prompt is rebuilt for every cache lookup, so its savings are recorded (`record_savings`)
+    when it is actually sent.
+    """
+    sizes = {name: count_tokens(text) for name, text in sources.items() if text}
+    before = sum(sizes.values())
+
+    shares = {}
+    remaining = budget
+    by_size = sorted(sizes, key=sizes.get)
+    for n, name in enumerate(by_size):
+        shares[name] = min(sizes[name], remaining // (len(by_size) - n))
+        remaining -= shares[name]
+
+    seen = set()
+    condensed = {name: condense(sources[name], shares[name], keywords, seen) for name in sizes}
+
+    after = sum(count_tokens(text) for text in condensed.values())
+    return condensed, before, after
+
+
+def record_savings(latin, before, after):
+    with _savings_lock:
+        savings.update(prompts=1, before=before, after=after)
+    if before > after:
+        logger.info(f"Condensed sources for {latin}: {before} -> {after} tokens (saved {before - after})")
+
+
+def summary():
+    if not savings["prompts"]:
+        return "Source condensation: nothing condensed"
+    saved = savings["before"] - savings["after"]
+    return f"Source condensation: {savings['before']} -> {savings['after']} tokens over {savings['prompts']} prompts (saved {saved})"
@@ -0,0 +1,19 @@
+# File names and source fields shared by scrapper.py and the light `cli.py` commands (status), which
+# import them from here so they never load Selenium. scrapper.py re-exports all of them.
+
+PLANT_ALL_LINK = "plant_all_link.json"
+SCRAPED_COMBINED = "scraped_data_combined.json"
+AI_EXTRACTED_FILE = "ai_extracted.json"
+# --shard: the SQLite lease queue the scrapper processes split the plant list through.
+WORK_QUEUE_FILE = "work_queue.sqlite"
+
+SOURCE_FIELDS = {"webmd": "textwebmd", "herbpathy": "textherbpathy", "pfaf": "textpfaf"}
+# What the fetchers store when a source could not be read, by kind of failure.
+FETCH_FAILURES = {
+    "Timeout or no content found.": "timeout",
+    " NO DATA FOUND": "no_data",
+    "Error: NO DATA FOUND": "no_data",
+    "No relevant content found.": "not_found",
+}
+# Failures worth fetching again; "not_found" (no page for the herb) is a definitive answer.
+RETRYABLE_FETCH_FAILURES = {"timeout", "no_data"}
@@ -0,0 +1,153 @@
+import copy
+import hashlib
+import logging
+import re
+import threading
+from collections import namedtuple
+
+from herb_index import normalize_latin_name
+from metrics import metrics
+
+SOURCE_FIELDS = ("textwebmd", "textherbpathy", "textpfaf")
+# Placeholders the fetchers store when a source had nothing; they say nothing about the herb.
+EMPTY_SOURCE_TEXTS = {" NO DATA FOUND", "Error: NO DATA FOUND", "Timeout or no content found.", "No relevant content found."}
+SHINGLE_WORDS = 3
+# Sources shorter than this (in shingles) are too thin to call two herbs the same.
+MIN_SHINGLES = 50
+# The combined text is mostly the WebMD monograph, which two different plants can share, so the PFAF
+# text is fingerprinted on its own as well and must match too (and be at least this long).
+MIN_PFAF_SHINGLES = 20
+# Simhashes this many bits apart or fewer count as near-duplicates; BANDS must be > this (pigeonhole).
+MAX_DISTANCE = 3
+BANDS = 4
+
+_WORD = re.compile(r"\w+")
+
+Match = namedtuple("Match", "latin_name herb kind distance")
+
+metrics.describe("terrapura_duplicate_sources_total", "counter", "Extractions reused from a herb with the same (exact) or nearly the same (near) sources.")
+
+
+def source_text(entry, fields=SOURCE_FIELDS):
+    """The combined source text of a herb, lowercased, with its own latin name blanked out.
+
+    PFAF pages of synonyms differ mostly in the name they are filed under, so it is removed
+    before comparing.
+    """
+    texts = [entry.get(field) or "" for field in fields]
+    text = "\n".join(t for t in texts if t not in EMPTY_SOURCE_TEXTS).lower()
+    latin = entry.get("latin_name", "").strip().lower()
+    if latin:
+        text = text.replace(latin, " ")
+    return " ".join(_WORD.findall(text))
+
+
+def fingerprint(entry):
+    """{"sha256", "simhash", "shingles"} of a herb's combined sources, plus the same for PFAF alone under "pfaf"."""
+    return dict(_text_fingerprint(source_text(entry)), pfaf=_text_fingerprint(source_text(entry, ["textpfaf"])))
+
+
+def _text_fingerprint(text):
+    words = text.split()
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(len(words) - SHINGLE_WORDS + 1, 0))}
+    hashes = [format(int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big"), "064b") for s in shingles]
+    # Column-wise bit counts (zip over the binary strings keeps the loop in C).
+    simhash = 0
+    for column in zip(*hashes):
+        simhash = (simhash << 1) | (column.count("1") * 2 > len(hashes))
+    return {
+        "sha256": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+        "simhash": format(simhash, "016x"),
+        "shingles": len(shingles),
+    }
+
+
+def derive_extraction(herb, latin_name):
+    """Another herb's extraction, filed under this latin name."""
+    derived = copy.deepcopy(herb)
+    derived.setdefault("Herb", {})["LatinName"] = latin_name
+    return derived
+
+
+class DuplicateIndex:
+    """Fingerprints of every extracted herb, to find herbs whose sources were already extracted.
+
+    Exact duplicates share the SHA-256 of their normalized sources; near-duplicates have simhashes
+    at most MAX_DISTANCE bits apart, found by splitting the simhash into BANDS bands and only
+    comparing herbs that share one band exactly.
+    """
+
+    def __init__(self):
+        self._herbs = {}  # normalized latin name -> (latin name, herb, fingerprint)
+        self._exact = {}
+        self._bands = [{} for _ in range(BANDS)]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _band_keys(simhash):
+        width = 64 // BANDS
+        return [(simhash >> (i * width)) & ((1 << width) - 1) for i in range(BANDS)]
+
+    def add(self, latin_name, fp, herb):
+        if fp["shingles"] < MIN_SHINGLES:
+            return
+        simhash = int(fp["simhash"], 16)
+        with self._lock:
+            self._herbs[normalize_latin_name(latin_name)] = (latin_name, herb, fp)
+            self._exact.setdefault(fp["sha256"], latin_name)
+            for band, key in zip(self._bands, self._band_keys(simhash)):
+                band.setdefault(key, []).append((simhash, latin_name))
+
+    @staticmethod
+    def _same_pfaf(fp, other_fp):
+        mine, theirs = fp.get("pfaf"), other_fp.get("pfaf")
+        if not mine or not theirs or min(mine["shingles"], theirs["shingles"]) < MIN_PFAF_SHINGLES:
+            return False
+        if mine["sha256"] == theirs["sha256"]:
+            return True
+        return bin(int(mine["simhash"], 16) ^ int(theirs["simhash"], 16)).count("1") <= MAX_DISTANCE
+
+    def find(self, latin_name, fp):
+        if fp["shingles"] < MIN_SHINGLES:
+            return None
+        own = normalize_latin_name(latin_name)
+        simhash = int(fp["simhash"], 16)
+        with self._lock:
+            candidates = []
+            other = self._exact.get(fp["sha256"])
+            if other:
+                candidates.append((0, "exact", other))
+            for band, key in zip(self._bands, self._band_keys(simhash)):
+                for candidate, other in band.get(key, ()):
+                    distance = bin(candidate ^ simhash).count("1")
+                    if distance <= MAX_DISTANCE:
+                        candidates.append((distance, "near", other))
+
+            for distance, kind, other in sorted(candidates):
+                _, herb, other_fp = self._herbs[normalize_latin_name(other)]
+                if normalize_latin_name(other) != own and self._same_pfaf(fp, other_fp):
+                    return Match(other, herb, kind, distance)
+        return None
+
+    def reuse(self, latin_name, fp):
+        """(herb, store updates) taken from a duplicate's extraction, or None if there is none."""
+        match = self.find(latin_name, fp)
+        if match is None:
+            return None
+        logging.info(f"Sources of {latin_name} match {match.latin_name} ({match.kind}, {match.distance} bits apart), reusing its extraction.")
+        metrics.inc("terrapura_duplicate_sources_total", kind=match.kind)
+        return derive_extraction(match.herb, latin_name), {"extracted": True, "fingerprint": fp, "duplicate_of": match.latin_name}
+
+    def load(self, store, sink):
+        """Index every herb that is both extracted and in the sink; returns records missing a fingerprint."""
+        missing = {}
+        for entry in store.records:
+            latin_name = entry["latin_name"]
+            herb = sink.records.get(normalize_latin_name(latin_name))
+            if not entry.get("extracted") or herb is None or not all(field in entry for field in SOURCE_FIELDS):
+                continue
+            fp = entry.get("fingerprint")
+            if fp is None or "pfaf" not in fp:  # kept before PFAF had its own fingerprint
+                fp = missing[latin_name] = fingerprint(entry)
+            self.add(latin_name, fp, herb)
+        return missing
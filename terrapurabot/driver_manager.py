@@ -0,0 +1,171 @@
+import logging
+import os
+
+from selenium.common.exceptions import InvalidSessionIdException, NoSuchWindowException, WebDriverException
+
+from metrics import metrics
+
+# Errors after which the browser is gone for good: only a new driver helps.
+DEAD_SESSION_MARKERS = (
+    "invalid session id",
+    "session deleted",
+    "no such window",
+    "tab crashed",
+    "chrome not reachable",
+    "disconnected",
+    "max retries exceeded",
+    "connection refused",
+)
+
+metrics.describe("terrapura_driver_restarts_total", "counter", "Chrome drivers replaced, by reason (pages, memory, crashed).")
+metrics.describe("terrapura_driver_rss_bytes", "gauge", "Resident memory of each driver's Chrome and chromedriver processes.")
+
+
+def is_dead_session(error):
+    if isinstance(error, (InvalidSessionIdException, NoSuchWindowException)):
+        return True
+    if isinstance(error, (WebDriverException, ConnectionError)) or type(error).__name__ in ("MaxRetryError", "ProtocolError"):
+        message = str(error).lower()
+        return any(marker in message for marker in DEAD_SESSION_MARKERS)
+    return False
+
+
+def process_tree_rss(root_pids):
+    """Resident memory in bytes of these processes and all their descendants, read from /proc.
+
+    None where there is no /proc (the memory limit is then not enforced).
+    """
+    try:
+        pids = [int(name) for name in os.listdir("/proc") if name.isdigit()]
+    except OSError:
+        return None
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    children, rss = {}, {}
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat", "r") as f:
+                # The command name may contain spaces, so the fields are counted from the last ")".
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        children.setdefault(int(fields[1]), []).append(pid)
+        rss[pid] = int(fields[21]) * page_size
+
+    total, todo, seen = 0, [pid for pid in root_pids if pid in rss], set()
+    while todo:
+        pid = todo.pop()
+        if pid in seen:
+            continue
+        seen.add(pid)
+        total += rss.get(pid, 0)
+        todo.extend(children.get(pid, []))
+    return total
+
+
+class ManagedDriver:
+    """Stands in for a Chrome driver: starts it on first use, replaces it when it is worn out or dead.
+
+    Between steps (`step`), the browser is recycled after `max_pages` page loads or once its process
+    tree uses more than `max_rss_mb`. A step during which the session died (renderer crash,
+    chromedriver gone) is run once more on a fresh browser. `sessions` holds per-browser helpers
+    (such as the Herbpathy search session) and is emptied whenever the browser goes.
+    """
+
+    def __init__(self, start, max_pages=0, max_rss_mb=0, name="driver"):
+        self._start = start
+        self._driver = None
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.name = name
+        self.pages = 0
+        self.dead = False
+        self.sessions = {}
+
+    def _current(self):
+        if self._driver is None:
+            self._driver = self._start()
+            self.pages = 0
+            self.dead = False
+        return self._driver
+
+    def _failed(self, error):
+        if is_dead_session(error):
+            self.dead = True
+
+    def __getattr__(self, name):
+        driver = self._current()
+        try:
+            value = getattr(driver, name)
+        except Exception as e:  # properties such as page_source and current_url talk to the browser too
+            self._failed(e)
+            raise
+        if not callable(value):
+            return value
+
+        def call(*args, **kwargs):
+            if name == "get":
+                self.pages += 1
+            try:
+                return value(*args, **kwargs)
+            except Exception as e:
+                self._failed(e)
+                raise
+        return call
+
+    def rss_bytes(self):
+        if self._driver is None:
+            return 0
+        pids = [getattr(self._driver, "browser_pid", None)]
+        process = getattr(getattr(self._driver, "service", None), "process", None)
+        pids.append(getattr(process, "pid", None))
+        return process_tree_rss([pid for pid in pids if pid])
+
+    def recycle_reason(self):
+        if self._driver is None:
+            return None
+        if self.dead:
+            return "crashed"
+        if self.max_pages and self.pages >= self.max_pages:
+            return "pages"
+        rss = self.rss_bytes()
+        if rss is not None:
+            metrics.set("terrapura_driver_rss_bytes", rss, driver=self.name)
+            if self.max_rss_mb and rss > self.max_rss_mb * 1024 * 1024:
+                return "memory"
+        return None
+
+    def restart(self, reason):
+        logging.info(f"[{self.name}] Restarting Chrome ({reason}) after {self.pages} pages.")
+        metrics.inc("terrapura_driver_restarts_total", reason=reason)
+        self.quit()
+
+    def step(self, run):
+        """Run one scraping step (a callable using this driver) and return its result.
+
+        If the browser died during the step, a new one is started and the step is run again, once.
+        """
+        reason = self.recycle_reason()
+        if reason:
+            self.restart(reason)
+        self.dead = False
+        result = run()
+        if self.dead:
+            self.restart("crashed")
+            result = run()
+        return result
+
+    def quit(self):
+        driver, self._driver = self._driver, None
+        self.sessions.clear()
+        if driver is not None:
+            metrics.set("terrapura_driver_rss_bytes", 0, driver=self.name)
+            try:
+                driver.quit()
+            except Exception as e:  # a crashed browser may not quit cleanly
+                logging.warning(f"[{self.name}] Could not quit Chrome: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.quit()
@@ -0,0 +1,145 @@
+import glob
+import json
+import logging
+import os
+
+from file_lock import FileLock
+from herb_index import normalize_latin_name
+
+
+class ExtractedSink:
+    """Streams GPT-extracted herbs to an append-only JSONL log.
+
+    Records are buffered and appended `flush_every` at a time, with an fsync every `fsync_every`
+    records, instead of re-reading and rewriting `ai_extracted.json` for each herb. Records are
+    keyed on latin name, so extracting a herb again replaces it rather than duplicating it.
+    `finalize()` writes the usual JSON array to `output_file`. A `read_only` sink only loads; any
+    other holds `<output>.lock` until it is closed (see RecordStore).
+
+    With `worker` set (sharded runs), herbs go to the worker's own `<output>.<worker>.jsonl` and
+    `output_file` is left alone. Every sink loads all worker logs too (`catch_up()` reloads what
+    they gained since), and closing a sink opened without `worker` appends the worker logs to the
+    main log and deletes them (only do that once every worker has stopped).
+    """
+
+    def __init__(self, output_file, log_path=None, flush_every=10, fsync_every=50, read_only=False, worker=None):
+        base = os.path.splitext(output_file)[0]
+        self.output_file = output_file
+        self.main_log_path = base + ".jsonl"
+        self.log_path = log_path or (f"{base}.{worker}.jsonl" if worker else self.main_log_path)
+        self.flush_every = flush_every
+        self.fsync_every = fsync_every
+        self.read_only = read_only
+        self.worker = worker
+        self.records = {}
+        self._buffer = []
+        self._unsynced = 0
+        self._offsets = {}  # log path -> bytes loaded so far
+        self._lock = None if read_only else FileLock(base + ".lock", shared=bool(worker))
+        self._load()
+        self._log = None if read_only else open(self.log_path, "a", encoding="utf-8")
+
+    def _worker_logs(self):
+        base = os.path.splitext(self.output_file)[0]
+        return sorted(glob.glob(glob.escape(base) + ".*.jsonl"))
+
+    def _read_log(self, path):
+        if not os.path.exists(path):
+            return
+        good_bytes = self._offsets.get(path, 0)
+        with open(path, "rb") as f:
+            f.seek(good_bytes)
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                try:
+                    line = json.loads(raw)
+                except json.JSONDecodeError:
+                    break
+                self.records[normalize_latin_name(line["latin_name"])] = line["herb"]
+                good_bytes += len(raw)
+        self._offsets[path] = good_bytes
+        # Another worker's log may just be mid-append, so only our own torn tail is ever cut.
+        if path == self.log_path and good_bytes < os.path.getsize(path) and not self.read_only:
+            logging.warning(f"Dropping torn tail of {path}.")
+            with open(path, "r+b") as f:
+                f.truncate(good_bytes)
+
+    def catch_up(self):
+        for path in [self.main_log_path] + self._worker_logs():
+            if path != self.log_path:
+                self._read_log(path)
+
+    def _load(self):
+        if os.path.exists(self.main_log_path) or self._worker_logs():
+            self._read_log(self.log_path)
+            self.catch_up()
+            return
+
+        # First run with the sink: carry over whatever ai_extracted.json already holds.
+        try:
+            with open(self.output_file, "r", encoding="utf-8") as f:
+                existing = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        for herb in existing:
+            latin_name = herb.get("Herb", {}).get("LatinName", "")
+            if latin_name:
+                self._buffer.append({"latin_name": latin_name, "herb": herb})
+                self.records[normalize_latin_name(latin_name)] = herb
+
+    def has(self, latin_name):
+        return normalize_latin_name(latin_name) in self.records
+
+    def add(self, herb, latin_name=None):
+        if self.read_only:
+            raise RuntimeError(f"{self.log_path} was opened read-only")
+        latin_name = latin_name or herb.get("Herb", {}).get("LatinName", "")
+        if not latin_name:
+            logging.error("Extracted herb has no latin name, not saving it.")
+            return
+        self.records[normalize_latin_name(latin_name)] = herb
+        self._buffer.append({"latin_name": latin_name, "herb": herb})
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self, sync=False):
+        if self._buffer:
+            self._log.write("".join(json.dumps(line, ensure_ascii=False) + "\n" for line in self._buffer))
+            self._log.flush()
+            self._unsynced += len(self._buffer)
+            self._buffer = []
+        if self._unsynced and (sync or self._unsynced >= self.fsync_every):
+            os.fsync(self._log.fileno())
+            self._unsynced = 0
+
+    def _merge_worker_logs(self):
+        worker_logs = self._worker_logs()
+        for path in worker_logs:
+            with open(path, "r", encoding="utf-8") as f:
+                data = f.read()
+            self._log.write(data[:data.rfind("\n") + 1])  # complete lines only
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        for path in worker_logs:
+            os.remove(path)
+            self._offsets.pop(path, None)
+
+    def finalize(self):
+        self.flush(sync=True)
+        if self.worker:
+            return  # output_file is shared; it is written when the worker logs are merged
+        self.catch_up()
+        self._merge_worker_logs()
+        tmp_path = self.output_file + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(list(self.records.values()), f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.output_file)
+
+    def close(self):
+        if self.read_only:
+            return
+        self.finalize()
+        self._log.close()
+        if self._lock:
+            self._lock.release()
@@ -0,0 +1,150 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from herb_schema import find_empty_fields, set_path
+
+FILLER = "Lorem ipsum dolor sit amet, consectetur adipiscing elit."
+
+
+def _fill_all(data, only_some=False):
+    for i, path in enumerate(find_empty_fields(data)):
+        # Leave every other field empty on the first pass so the fill-in step has work to do.
+        if only_some and i % 2:
+            continue
+        set_path(data, path, _value_for(path))
+    return data
+
+
+def _value_for(path):
+    if path.endswith("Order"):
+        return 1
+    if path == "Herb.Tags":
+        return ["herbal"]
+    return FILLER
+
+
+def _json_after(marker, prompt):
+    return json.loads(prompt.split(marker, 1)[1].strip())
+
+
+def fake_reply(prompt):
+    """A plausible reply for each of the prompts ai_extractor sends."""
+    if "Return ONLY valid JSON in this structure:" in prompt:
+        return json.dumps(_fill_all(_json_after("Return ONLY valid JSON in this structure:", prompt), only_some=True))
+    if "Current JSON (fill missing fields only):" in prompt:
+        return json.dumps(_fill_all(_json_after("Current JSON (fill missing fields only):", prompt)))
+    match = re.search(r"These fields are empty in the JSON for the herb .*?:\n(.*?)\n\nINSTRUCTIONS:", prompt, re.S)
+    paths = match.group(1).split("\n") if match else []
+    return json.dumps({path: _value_for(path) for path in paths})
+
+
+def fake_completion(body):
+    prompt = body["messages"][-1]["content"]
+    content = fake_reply(prompt)
+    prompt_tokens = sum(len(m["content"]) for m in body["messages"]) // 4
+    completion_tokens = len(content) // 4
+    return {
+        "id": f"chatcmpl-fake-{random.getrandbits(32):08x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+def process_batch(requests_path, results_path, failure_ratio=0.0):
+    """Answer a Batch API requests file the way OpenAI's batch runner would, writing its results file."""
+    with open(requests_path, "r", encoding="utf-8") as f, open(results_path, "w", encoding="utf-8") as out:
+        for raw in f:
+            if not raw.strip():
+                continue
+            line = json.loads(raw)
+            result = {"id": f"batch_req_{random.getrandbits(32):08x}", "custom_id": line["custom_id"], "response": None, "error": None}
+            if random.random() < failure_ratio:
+                result["error"] = {"code": "server_error", "message": "Fake batch failure"}
+            else:
+                result["response"] = {"status_code": 200, "request_id": result["id"], "body": fake_completion(line["body"])}
+            out.write(json.dumps(result) + "\n")
+
+
+class FakeOpenAI:
+    """Local OpenAI-compatible /v1/chat/completions endpoint with configurable latency and 429 injection."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, rate_limit_ratio=0.0):
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.requests = 0
+        self.rate_limited = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))) or b"{}")
+                server.requests += 1
+                if self.path.rstrip("/").endswith("/chat/completions"):
+                    if random.random() < server.rate_limit_ratio:
+                        server.rate_limited += 1
+                        return self._send(429, {"error": {"message": "Rate limit reached (fake)", "type": "rate_limit_error"}}, {"retry-after": "0.2"})
+                    time.sleep(server.latency)
+                    return self._send(200, fake_completion(body))
+                self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+            def _send(self, status, payload, headers=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake OpenAI chat completions API (or answer a batch file) for local testing.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per completion")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--batch", nargs=2, metavar=("REQUESTS", "RESULTS"), help="answer a batch requests file offline and exit")
+    args = parser.parse_args()
+
+    if args.batch:
+        process_batch(*args.batch, failure_ratio=args.rate_limit)
+        return
+
+    server = FakeOpenAI(port=args.port, latency=args.latency, rate_limit_ratio=args.rate_limit)
+    print(f"Fake OpenAI listening on {server.url}")
+    server.httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, runs are not protected from each other
+    fcntl = None
+
+
+class FileInUse(RuntimeError):
+    pass
+
+
+class FileLock:
+    """Advisory lock on a `.lock` file next to the data it guards, held until `release()`.
+
+    A process that rewrites the shared files (compaction, merging) takes it exclusively. So a
+    second such run, or one started alongside shard workers (which hold it shared), fails at once
+    with FileInUse instead of losing updates.
+    """
+
+    def __init__(self, path, shared=False):
+        self.path = path
+        self._file = open(path, "a")
+        if fcntl is None:
+            return
+        try:
+            fcntl.flock(self._file.fileno(), (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+        except OSError:
+            self._file.close()
+            raise FileInUse(f"{os.path.splitext(path)[0]} is in use by another run (lock {path})") from None
+
+    def release(self):
+        if not self._file.closed:
+            self._file.close()
@@ -1,43 +1,132 @@
+import json
+import re
+import string
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse
+
 import requests
 from bs4 import BeautifulSoup
-import string
-import time
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-def get_links_from_letter(letter):
-    base_url = "https://pfaf.org/user/DatabaseSearhResult.aspx?LatinName={}%"  # % is URL encoded
-    url = base_url.format(letter)
-    
-    headers = {
-        "User-Agent": "Mozilla/5.0"
-    }
-    
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200:
-        print(f"Failed to fetch page for letter {letter}")
-        return []
+from throttle import SiteLimiter
 
-    soup = BeautifulSoup(response.content, "html.parser")
-    links = soup.select('td[align="left"] a')
+BASE_URL = "https://pfaf.org/user/DatabaseSearhResult.aspx?LatinName={}%"  # % is URL encoded
+OUTPUT_FILE = "plant_all_link.json"
+STREAM_FILE = "plant_all_link.jsonl"
+HEADERS = {"User-Agent": "Mozilla/5.0"}
 
-    return [{"url": "https://pfaf.org/user/" + link.get("href")} for link in links if link.get("href")]
+MAX_WORKERS = 8        # letters fetched at once
+HOST_CONCURRENCY = 4   # requests in flight per host
+HOST_MIN_INTERVAL = 0.25  # polite gap between requests to the same host, in seconds
 
-def main():
-    with open("plant_all_link.json", "w", encoding="utf-8") as f:
+_POSTBACK = re.compile(r"__doPostBack\('([^']*)','(Page\$\d+)'\)")
+
+
+def get_session():
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    retry = Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET", "POST"])
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=HOST_CONCURRENCY, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def parse_results_page(content):
+    """Plant links, GridView pager postbacks ({"Page$2": target, ...}) and the hidden form fields of a result page."""
+    soup = BeautifulSoup(content, "html.parser")
+    links = [urljoin("https://pfaf.org/user/", a["href"]) for a in soup.select('td[align="left"] a') if a.get("href")]
+
+    pages = {}
+    for a in soup.select('a[href*="__doPostBack"]'):
+        match = _POSTBACK.search(a["href"])
+        if match:
+            pages[match.group(2)] = match.group(1)
+
+    form = {field["name"]: field.get("value", "") for field in soup.select('input[type="hidden"][name]')}
+    return links, pages, form
+
+
+class LinkHarvester:
+    def __init__(self, session=None, limiter=None):
+        self.session = session or get_session()
+        self.limiter = limiter or SiteLimiter({"pfaf.org": HOST_CONCURRENCY}, {"pfaf.org": HOST_MIN_INTERVAL})
+        self.seen = set()
+        self._lock = threading.Lock()
+        self._out = None
+
+    def _request(self, method, url, **kwargs):
+        with self.limiter.slot(urlparse(url).hostname.removeprefix("www.")):
+            response = self.session.request(method, url, timeout=30, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def _emit(self, links):
+        new = 0
+        with self._lock:
+            for url in links:
+                if url in self.seen:
+                    continue
+                self.seen.add(url)
+                self._out.write(json.dumps({"url": url}, ensure_ascii=False) + "\n")
+                new += 1
+            self._out.flush()
+        return new
+
+    def harvest_letter(self, letter):
+        url = BASE_URL.format(letter)
+        try:
+            response = self._request("GET", url)
+        except requests.RequestException as e:
+            print(f"Failed to fetch page for letter {letter}: {e}")
+            return 0
+
+        links, pages, form = parse_results_page(response.content)
+        found = self._emit(links)
+
+        # ASP.NET GridView paging: each further page is a postback carrying the previous page's view state.
+        visited = {"Page$1"}
+        while True:
+            pending = sorted((p for p in pages if p not in visited), key=lambda p: int(p.split("$")[1]))
+            if not pending:
+                break
+            page = pending[0]
+            visited.add(page)
+            data = dict(form, __EVENTTARGET=pages[page], __EVENTARGUMENT=page)
+            try:
+                response = self._request("POST", url, data=data)
+            except requests.RequestException as e:
+                print(f"Failed to fetch {page} for letter {letter}: {e}")
+                break
+            links, more_pages, form = parse_results_page(response.content)
+            pages.update(more_pages)
+            found += self._emit(links)
+
+        print(f"Processed: {letter} ({found} links, {len(visited)} pages)")
+        return found
+
+    def run(self, letters=string.ascii_uppercase, stream_file=STREAM_FILE):
+        with open(stream_file, "w", encoding="utf-8") as self._out:
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+                total = sum(pool.map(self.harvest_letter, letters))
+        return total
+
+
+def write_link_index(stream_file=STREAM_FILE, output_file=OUTPUT_FILE):
+    # Same layout as before (one object per line inside a JSON array) so scrapper.py reads it unchanged.
+    with open(stream_file, "r", encoding="utf-8") as src, open(output_file, "w", encoding="utf-8") as f:
         f.write("[\n")
-        first = True
-        for letter in string.ascii_uppercase:
-            print(f"Processing: {letter}")
-            links = get_links_from_letter(letter)
-            for link_obj in links:
-                if not first:
-                    f.write(",\n")
-                f.write(json.dumps(link_obj, ensure_ascii=False))
-                first = False
-            time.sleep(1)  # polite delay
+        f.write(",\n".join(line.rstrip("\n") for line in src if line.strip()))
         f.write("\n]")
 
-    print("Finished writing links to pfaf_links.json")
+
+def main():
+    harvester = LinkHarvester()
+    total = harvester.run()
+    write_link_index()
+    print(f"Finished writing {total} links to {OUTPUT_FILE}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+
+def request_key(request):
+    """Content address of a chat request: model, temperature, max_tokens and the exact system/user prompts."""
+    canonical = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """On-disk (SQLite) cache of GPT replies keyed by `request_key`.
+
+    Least recently used replies are evicted once the stored content passes `max_bytes`. With
+    `bypass` set, lookups always miss but fresh replies are still stored, which refreshes the cache.
+    WAL only works between processes on one host; pass `wal=False` when processes on several hosts
+    share the file (shard mode) to use the rollback journal instead.
+    """
+
+    def __init__(self, path, max_bytes=500 * 1024 * 1024, bypass=False, wal=True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._conn.execute(f"PRAGMA journal_mode={'WAL' if wal else 'DELETE'}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, content TEXT NOT NULL,"
+            " size INTEGER NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, request):
+        if self.bypass:
+            self.misses += 1
+            return None
+        key = request_key(request)
+        with self._lock:
+            row = self._conn.execute("SELECT content FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, request, content):
+        key = request_key(request)
+        size = len(content.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, content, size, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, request.get("model"), content, size, now, now),
+            )
+            self._size += size - (old[0] if old else 0)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Drop the least recently used replies until we are back under 90% of the limit.
+        target = self.max_bytes * 0.9
+        freed = 0
+        evicted = 0
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            if self._size - freed <= target:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            freed += size
+            evicted += 1
+        self._size -= freed
+        logging.info(f"GPT cache evicted {evicted} replies ({freed / 1024:.0f} KB).")
+
+    def summary(self):
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0
+        return f"GPT cache: {self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate), {self._size / 1024 / 1024:.1f} MB stored"
@@ -0,0 +1,218 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from herb_index import normalize_latin_name
+
+EXPORT_DB = "herbs.sqlite"
+EXPORT_PARQUET_DIR = "herbs_parquet"
+
+# One table per list in the herb document: (table, path to the list, [(column, key in each item)]).
+# Every child table also has latin_key (the normalized latin name) and position (index in the list).
+CHILD_TABLES = [
+    ("ailments", ("Herb", "AilmentsTreated"), [("name", "Name"), ("description", "Description")]),
+    ("side_effects", ("Herb", "SideEffects"), [("name", "Name"), ("description", "Description"), ("severity", "Severity")]),
+    ("preparation_steps", ("HerbPreparationSteps",), [
+        ("step_name", "StepName"), ("description", "Description"), ("duration", "Duration"),
+        ("temperature", "Temperature"), ("type", "Type"), ("step_order", "Order"),
+    ]),
+    ("warnings", ("HerbWarnings",), [
+        ("title", "WarningTitle"), ("description", "Description"), ("warning_type", "WarningType"), ("warning_order", "Order"),
+    ]),
+    ("studies", ("ScientificStudies",), [("title", "StudyTitle"), ("summary", "Summary"), ("doi", "DOI"), ("external_link", "ExternalLink")]),
+]
+HERB_COLUMNS = [("name", "Name"), ("description", "Description"), ("dosage", "Dosage"), ("sources", "Sources")]
+INTEGER_COLUMNS = {"step_order", "warning_order"}
+
+# Bumped whenever SCHEMA changes; the export is rebuilt from the sink, so an older database is dropped.
+SCHEMA_VERSION = 2
+
+# Searched columns are declared COLLATE NOCASE, so plain `=` queries are case-insensitive and use the index.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS herbs (
+    latin_key TEXT PRIMARY KEY,
+    latin_name TEXT NOT NULL,
+    name TEXT COLLATE NOCASE, description TEXT, dosage TEXT, sources TEXT,
+    content_sha256 TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS herbs_name ON herbs(name);
+CREATE TABLE IF NOT EXISTS tags (latin_key TEXT NOT NULL, name TEXT NOT NULL COLLATE NOCASE, PRIMARY KEY (latin_key, name));
+CREATE INDEX IF NOT EXISTS tags_name ON tags(name);
+CREATE TABLE IF NOT EXISTS ailments (latin_key TEXT NOT NULL, position INTEGER NOT NULL, name TEXT COLLATE NOCASE, description TEXT,
+    PRIMARY KEY (latin_key, position));
+CREATE INDEX IF NOT EXISTS ailments_name ON ailments(name);
+CREATE TABLE IF NOT EXISTS side_effects (latin_key TEXT NOT NULL, position INTEGER NOT NULL, name TEXT, description TEXT,
+    severity TEXT COLLATE NOCASE, PRIMARY KEY (latin_key, position));
+CREATE INDEX IF NOT EXISTS side_effects_severity ON side_effects(severity);
+CREATE TABLE IF NOT EXISTS preparation_steps (latin_key TEXT NOT NULL, position INTEGER NOT NULL, step_name TEXT, description TEXT,
+    duration TEXT, temperature TEXT, type TEXT, step_order INTEGER, PRIMARY KEY (latin_key, position));
+CREATE TABLE IF NOT EXISTS warnings (latin_key TEXT NOT NULL, position INTEGER NOT NULL, title TEXT, description TEXT,
+    warning_type TEXT COLLATE NOCASE, warning_order INTEGER, PRIMARY KEY (latin_key, position));
+CREATE INDEX IF NOT EXISTS warnings_type ON warnings(warning_type);
+CREATE TABLE IF NOT EXISTS studies (latin_key TEXT NOT NULL, position INTEGER NOT NULL, title TEXT, summary TEXT, doi TEXT,
+    external_link TEXT, PRIMARY KEY (latin_key, position));
+"""
+
+
+def _text(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False) if isinstance(value, (list, dict)) else str(value)
+
+
+def _integer(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _items(herb, path):
+    node = herb
+    for key in path:
+        node = node.get(key) if isinstance(node, dict) else None
+    return [item for item in node if isinstance(item, dict)] if isinstance(node, list) else []
+
+
+def _tags(herb):
+    # Herb.Tags is a list of strings, the top-level Tags a list of {"Name": ...}; both end up here.
+    names = [t for t in (herb.get("Herb") or {}).get("Tags") or [] if isinstance(t, str)]
+    names += [t.get("Name") for t in _items(herb, ("Tags",))]
+    # tags.name is COLLATE NOCASE, so "skin" and "Skin" are one tag; the first spelling is kept.
+    tags = {}
+    for name in names:
+        if isinstance(name, str) and name.strip():
+            tags.setdefault(name.strip().casefold(), name.strip())
+    return sorted(tags.values())
+
+
+def content_hash(herb):
+    return hashlib.sha256(json.dumps(herb, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class HerbExporter:
+    """Normalized, indexed SQLite copy of the extracted herbs, upserted on latin name.
+
+    Each herb's row remembers the hash of the document it came from, so re-exporting only
+    rewrites herbs whose extraction changed.
+    """
+
+    def __init__(self, path=EXPORT_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            with self.conn:
+                for table in ["herbs", "tags"] + [name for name, _, _ in CHILD_TABLES]:
+                    self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+        self.conn.executescript(SCHEMA)
+        self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _known_hashes(self):
+        return dict(self.conn.execute("SELECT latin_key, content_sha256 FROM herbs"))
+
+    def upsert(self, latin_key, herb, digest=None):
+        key = normalize_latin_name(latin_key)
+        info = herb.get("Herb") or {}
+        latin_name = info.get("LatinName") or latin_key
+        self.conn.execute(
+            "INSERT INTO herbs (latin_key, latin_name, name, description, dosage, sources, content_sha256, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(latin_key) DO UPDATE SET "
+            "latin_name=excluded.latin_name, name=excluded.name, description=excluded.description, dosage=excluded.dosage, "
+            "sources=excluded.sources, content_sha256=excluded.content_sha256, updated_at=excluded.updated_at",
+            [key, latin_name] + [_text(info.get(field)) for _, field in HERB_COLUMNS] + [digest or content_hash(herb), time.time()],
+        )
+        # Lists are replaced wholesale: the new extraction may have fewer items than the old one.
+        self.conn.execute("DELETE FROM tags WHERE latin_key = ?", (key,))
+        self.conn.executemany("INSERT INTO tags (latin_key, name) VALUES (?, ?)", [(key, tag) for tag in _tags(herb)])
+        for table, path, columns in CHILD_TABLES:
+            self.conn.execute(f"DELETE FROM {table} WHERE latin_key = ?", (key,))
+            rows = [
+                [key, position] + [(_integer if column in INTEGER_COLUMNS else _text)(item.get(field)) for column, field in columns]
+                for position, item in enumerate(_items(herb, path))
+            ]
+            names = ", ".join(["latin_key", "position"] + [column for column, _ in columns])
+            marks = ", ".join("?" * (len(columns) + 2))
+            self.conn.executemany(f"INSERT INTO {table} ({names}) VALUES ({marks})", rows)
+
+    def delete(self, key):
+        for table in ["herbs", "tags"] + [name for name, _, _ in CHILD_TABLES]:
+            self.conn.execute(f"DELETE FROM {table} WHERE latin_key = ?", (key,))
+
+    def export(self, herbs, full=False):
+        """Upsert every (latin key, herb) pair that changed since the last export and delete herbs no
+        longer among them; returns (written, unchanged, removed)."""
+        known = self._known_hashes()
+        seen = set()
+        written = unchanged = 0
+        with self.conn:
+            for latin_key, herb in herbs:
+                key = normalize_latin_name(latin_key)
+                seen.add(key)
+                digest = content_hash(herb)
+                if not full and known.get(key) == digest:
+                    unchanged += 1
+                    continue
+                self.upsert(key, herb, digest)
+                written += 1
+            removed = [key for key in known if key not in seen]
+            for key in removed:
+                self.delete(key)
+        return written, unchanged, len(removed)
+
+    def write_parquet(self, directory=EXPORT_PARQUET_DIR):
+        """One Parquet file per table, rewritten from the SQLite tables (cheap next to the upserts)."""
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:  # optional dependency
+            logging.warning("pyarrow is not installed, skipping the Parquet export.")
+            return False
+        os.makedirs(directory, exist_ok=True)
+        for table in ["herbs", "tags"] + [name for name, _, _ in CHILD_TABLES]:
+            cursor = self.conn.execute(f"SELECT * FROM {table} ORDER BY latin_key")
+            columns = [c[0] for c in cursor.description]
+            rows = cursor.fetchall()
+            data = pyarrow.table({column: [row[i] for row in rows] for i, column in enumerate(columns)})
+            tmp_path = os.path.join(directory, f"{table}.parquet.tmp")
+            pyarrow.parquet.write_table(data, tmp_path)
+            os.replace(tmp_path, os.path.join(directory, f"{table}.parquet"))
+        return True
+
+    def close(self):
+        self.conn.close()
+
+
+def sink_herbs(sink):
+    # Rows are keyed on the sink's key, not on GPT's LatinName, which may name the herb differently.
+    return iter(sink.records.items())
+
+
+def main(argv=None):
+    from extracted_sink import ExtractedSink
+    from config import AI_EXTRACTED_FILE
+
+    parser = argparse.ArgumentParser(description="Export extracted herbs to indexed SQLite tables (and Parquet).")
+    parser.add_argument("--db", default=EXPORT_DB)
+    parser.add_argument("--parquet", nargs="?", const=EXPORT_PARQUET_DIR, help=f"also write Parquet files (default dir {EXPORT_PARQUET_DIR})")
+    parser.add_argument("--full", action="store_true", help="rewrite every herb, not only the changed ones")
+    args = parser.parse_args(argv)
+
+    sink = ExtractedSink(AI_EXTRACTED_FILE, read_only=True)
+    exporter = HerbExporter(args.db)
+    try:
+        written, unchanged, removed = exporter.export(sink_herbs(sink), full=args.full)
+        print(f"{args.db}: {written} herbs written, {unchanged} unchanged, {removed} removed.")
+        if args.parquet and exporter.write_parquet(args.parquet):
+            print(f"Parquet files written to {args.parquet}/.")
+    finally:
+        exporter.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import re
+from urllib.parse import unquote_plus
+
+_SPACES = re.compile(r"\s+")
+_SYNONYM_SPLIT = re.compile(r"[;,]|\.\s+(?=[A-Z])")
+
+
+def normalize_latin_name(name):
+    """Case/spacing-insensitive form of a latin name ("Plantago+major " -> "plantago major")."""
+    name = unquote_plus(name or "").replace("×", "x")
+    return _SPACES.sub(" ", name).strip().lower()
+
+
+def parse_synonyms(text):
+    """Pull full names out of PFAF's free-text synonym field, skipping abbreviated ones like "P. major"."""
+    synonyms = []
+    for part in _SYNONYM_SPLIT.split(text or ""):
+        words = part.strip().rstrip(".").split()
+        if len(words) < 2 or not words[0][:1].isupper() or len(words[0]) <= 2:
+            continue
+        # Genus plus the lower-case epithets that follow it; stop at the author citation.
+        name = [words[0]]
+        for word in words[1:]:
+            if not word[:1].islower():
+                break
+            name.append(word)
+        if len(name) >= 2:
+            synonyms.append(" ".join(name))
+    return synonyms
+
+
+class HerbIndex:
+    """Normalized latin name -> entry, built once at load and maintained on every insert."""
+
+    def __init__(self, entries=()):
+        self._names = {}
+        for entry in entries:
+            self.add(entry)
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, entry):
+        self._names[normalize_latin_name(entry["latin_name"])] = entry
+
+    def get(self, latin_name):
+        return self._names.get(normalize_latin_name(latin_name))
@@ -0,0 +1,148 @@
+import copy
+import json
+import re
+import sys
+from collections import Counter
+
+# The herb document GPT fills in, written once. It doubles as the prompt template:
+#   "" -> text field, 1 -> number field (value is the template default),
+#   [] -> list of plain values, [{...}] -> list of objects.
+HERB_TEMPLATE = {
+    "Herb": {
+        "Name": "",
+        "LatinName": "",
+        "Description": "",
+        "Dosage": "",
+        "Tags": [],
+        "Sources": "",
+        "AilmentsTreated": [{"Name": "", "Description": ""}],
+        "SideEffects": [{"Name": "", "Description": "", "Severity": "mild"}],
+    },
+    "HerbPreparationSteps": [{"StepName": "", "Description": "", "Duration": "", "Temperature": "", "Type": "", "Order": 1}],
+    "HerbWarnings": [{"WarningTitle": "", "Description": "", "WarningType": "", "Order": 1}],
+    "ScientificStudies": [{"StudyTitle": "", "Summary": "", "DOI": "", "ExternalLink": ""}],
+    "Tags": [{"Name": ""}],
+}
+
+
+def build_template(latin_name):
+    template = copy.deepcopy(HERB_TEMPLATE)
+    template["Herb"]["LatinName"] = latin_name
+    return template
+
+
+# ------------------------- PATHS -------------------------
+
+_PATH_TOKEN = re.compile(r"([^.\[\]]+)|\[(\d+)\]")
+
+
+def parse_path(path):
+    """"HerbWarnings[1].Order" -> ["HerbWarnings", 1, "Order"]"""
+    return [int(index) if index else key for key, index in _PATH_TOKEN.findall(path)]
+
+
+def set_path(data, path, value):
+    """Set a value at a validator path, creating any missing objects and list elements on the way."""
+    keys = parse_path(path)
+    node = data
+    for key, next_key in zip(keys, keys[1:]):
+        container = list if isinstance(next_key, int) else dict
+        if isinstance(key, int):
+            while len(node) <= key:
+                node.append(container())
+            if not isinstance(node[key], container):
+                node[key] = container()
+        elif not isinstance(node.get(key), container):
+            node[key] = container()
+        node = node[key]
+
+    last = keys[-1]
+    if isinstance(last, int):
+        while len(node) <= last:
+            node.append(None)
+    node[last] = value
+
+
+# ------------------------- VALIDATOR -------------------------
+
+def _compile(schema):
+    """Turn a schema node into a `check(value, path, out)` closure that appends empty paths to `out`."""
+    if isinstance(schema, dict):
+        fields = [(key, _compile(sub)) for key, sub in schema.items()]
+
+        def check_object(value, path, out):
+            if not isinstance(value, dict):
+                value = {}
+            prefix = path + "." if path else ""
+            for key, check in fields:
+                check(value.get(key), prefix + key, out)
+        return check_object
+
+    if isinstance(schema, list) and not schema:
+        def check_values(value, path, out):
+            if not value:
+                out.append(path)
+        return check_values
+
+    if isinstance(schema, list):
+        check_item = _compile(schema[0])
+
+        def check_list(value, path, out):
+            # An empty list is reported as its first element, e.g. "HerbWarnings[0].Description".
+            if not isinstance(value, list) or not value:
+                value = [None]
+            for i, item in enumerate(value):
+                check_item(item, f"{path}[{i}]", out)
+        return check_list
+
+    if isinstance(schema, str):
+        def check_text(value, path, out):
+            if value is None or (isinstance(value, str) and not value.strip()):
+                out.append(path)
+        return check_text
+
+    def check_number(value, path, out):
+        if not value:
+            out.append(path)
+    return check_number
+
+
+_check_herb = _compile(HERB_TEMPLATE)
+
+
+def find_empty_fields(data):
+    """Every empty path in an extracted herb, across all list elements."""
+    empties = []
+    _check_herb(data, "", empties)
+    return empties
+
+
+def validate_batch(records):
+    """Empty paths for a whole batch of extracted herbs: {latin name: [paths]} for incomplete herbs only."""
+    report = {}
+    for i, data in enumerate(records):
+        empties = []
+        _check_herb(data, "", empties)
+        if empties:
+            latin_name = (data.get("Herb") or {}).get("LatinName") or f"#{i}"
+            report[latin_name] = empties
+    return report
+
+
+_INDEX = re.compile(r"\[\d+\]")
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else "ai_extracted.json"
+    with open(path, "r", encoding="utf-8") as f:
+        records = json.load(f)
+
+    report = validate_batch(records)
+    by_field = Counter(field for empties in report.values() for field in {_INDEX.sub("[]", p) for p in empties})
+    print(f"{len(records) - len(report)}/{len(records)} herbs complete")
+    for field, count in by_field.most_common():
+        print(f"{count:8d}  {field}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class HtmlArchive:
+    """Every fetched page, gzip-compressed and stored under the SHA-256 of its content.
+
+    `index.jsonl` records one line per fetch (kind, latin name, URL, fetch time, content hash),
+    so the same page fetched twice is stored once but both fetches are listed.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.index_path = os.path.join(root, "index.jsonl")
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+
+    def _object_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], digest + ".html.gz")
+
+    def capture(self, kind, latin_name, url, page_html):
+        data = page_html.encode("utf-8") if isinstance(page_html, str) else page_html
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with gzip.open(tmp_path, "wb", compresslevel=6) as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+        line = {"kind": kind, "latin_name": latin_name, "url": url, "fetched_at": time.time(), "sha256": digest}
+        with self._lock, open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        return digest
+
+    def entries(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            for raw in f:
+                try:
+                    yield json.loads(raw)
+                except json.JSONDecodeError:
+                    continue
+
+    def latest(self):
+        """The most recent capture for each (latin name, kind)."""
+        latest = {}
+        for line in self.entries():
+            latest[(line["latin_name"], line["kind"])] = line
+        return latest
+
+    def load(self, digest):
+        with gzip.open(self._object_path(digest), "rb") as f:
+            return f.read().decode("utf-8", errors="replace")
@@ -0,0 +1,217 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from timing import BUCKETS
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Metrics:
+    """Counters, gauges and histograms for a run, rendered in the Prometheus text format.
+
+    Names are registered on first use. Collectors (`add_collector`) run right before every render
+    to refresh values that live elsewhere, such as queue depths. `labels` are added to every
+    rendered series (e.g. the worker id, when several processes export the same names).
+    """
+
+    def __init__(self):
+        self.labels = {}
+        self._values = {}  # name -> {label key: value}
+        self._histograms = {}  # name -> {label key: [bucket counts, sum, count]}
+        self._types = {}
+        self._help = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, kind, help_text):
+        self._types[name] = kind
+        self._help[name] = help_text
+
+    def inc(self, name, amount=1, **labels):
+        with self._lock:
+            self._types.setdefault(name, "counter")
+            series = self._values.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._types.setdefault(name, "gauge")
+            self._values.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        with self._lock:
+            self._types.setdefault(name, "histogram")
+            series = self._histograms.setdefault(name, {})
+            bucket = series.setdefault(_label_key(labels), [[0] * len(BUCKETS), 0.0, 0])
+            bucket[0][next(i for i, bound in enumerate(BUCKETS) if seconds <= bound)] += 1
+            bucket[1] += seconds
+            bucket[2] += 1
+
+    def set_histogram(self, name, counts, total, count, **labels):
+        """Replace a histogram wholesale, for latencies already bucketed elsewhere (BUCKETS bounds)."""
+        with self._lock:
+            self._types.setdefault(name, "histogram")
+            self._histograms.setdefault(name, {})[_label_key(labels)] = [list(counts), total, count]
+
+    def get(self, name, **labels):
+        with self._lock:
+            return self._values.get(name, {}).get(_label_key(labels), 0)
+
+    def total(self, name):
+        """Sum of a counter over all its labels."""
+        with self._lock:
+            return sum(self._values.get(name, {}).values())
+
+    def add_collector(self, collect):
+        self._collectors.append(collect)
+
+    def collect(self):
+        for collect in list(self._collectors):
+            try:
+                collect(self)
+            except Exception as e:
+                logging.warning(f"Metrics collector failed: {e}")
+
+    def render(self):
+        self.collect()
+        lines = []
+        extra = sorted(self.labels.items())
+        with self._lock:
+            for name in sorted(set(self._values) | set(self._histograms)):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {self._types.get(name, 'untyped')}")
+                for key, value in sorted(self._values.get(name, {}).items()):
+                    lines.append(f"{name}{_format_labels(key, extra)} {value:g}")
+                for key, (counts, total, count) in sorted(self._histograms.get(name, {}).items()):
+                    cumulative = 0
+                    for bound, n in zip(BUCKETS, counts):
+                        cumulative += n
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        lines.append(f"{name}_bucket{_format_labels(key, extra + [('le', le)])} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key, extra)} {total:g}")
+                    lines.append(f"{name}_count{_format_labels(key, extra)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        # node_exporter may read the file at any moment, so it is replaced atomically.
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def serve(self, port, host="0.0.0.0"):
+        """Expose /metrics over HTTP from a daemon thread; returns the server so it can be shut down."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                data = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("content-type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("content-length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        logging.info(f"Metrics served on http://{host}:{server.server_address[1]}/metrics")
+        return server
+
+
+metrics = Metrics()
+
+metrics.describe("terrapura_page_loads_total", "counter", "Pages requested, by site and how (browser or http).")
+metrics.describe("terrapura_fetch_results_total", "counter", "Source fetches by site and outcome (ok, timeout, no_data, not_found).")
+metrics.describe("terrapura_herbs_done_total", "counter", "Herbs that went through every step of this run.")
+metrics.describe("terrapura_herbs_planned", "gauge", "Herbs this run will go through.")
+metrics.describe("terrapura_gpt_calls_total", "counter", "OpenAI calls made (cache hits excluded), by step.")
+metrics.describe("terrapura_gpt_tokens_total", "counter", "OpenAI tokens used, by step and kind (prompt or completion).")
+metrics.describe("terrapura_gpt_cache_hits_total", "counter", "GPT replies served from the response cache, by step.")
+metrics.describe("terrapura_gpt_retries_total", "counter", "OpenAI calls retried after a rate limit or server error.")
+metrics.describe("terrapura_queue_depth", "gauge", "Items waiting in each queue.")
+metrics.describe("terrapura_driver_starts_total", "counter", "Chrome drivers started.")
+metrics.describe("terrapura_step_seconds", "histogram", "Time per site/step, as seen by the latency tracker.")
+
+
+class ProgressReporter(threading.Thread):
+    """Every `interval` seconds: refresh the textfile (if any) and log one throughput/ETA line.
+
+    Throughput is measured over the last `window` ticks, so herbs skipped quickly at start-up
+    (already done by an earlier run) stop counting once they fall out of the window.
+    """
+
+    def __init__(self, registry=metrics, interval=60, textfile=None, window=10):
+        super().__init__(name="metrics-reporter", daemon=True)
+        self.registry = registry
+        self.interval = interval
+        self.textfile = textfile
+        self._samples = deque(maxlen=window + 1)
+        self._stopping = threading.Event()
+
+    def progress_line(self):
+        done = self.registry.total("terrapura_herbs_done_total")
+        planned = self.registry.get("terrapura_herbs_planned")
+        now = time.monotonic()
+        self._samples.append((now, done))
+        then, done_then = self._samples[0]
+        rate = (done - done_then) / (now - then) * 60 if now > then else 0.0
+
+        remaining = max(planned - done, 0)
+        if rate > 0:
+            minutes = remaining / rate
+            eta = f"{int(minutes // 60)}h{int(minutes % 60):02d}m"
+        else:
+            eta = "stalled" if done < planned else "done"
+
+        failures = self.registry.total("terrapura_fetch_results_total") - sum(
+            self.registry.get("terrapura_fetch_results_total", site=site, outcome="ok") for site in ("webmd", "herbpathy", "pfaf")
+        )
+        share = f" ({done / planned:.1%})" if planned else ""
+        return (
+            f"Progress: {done:g}/{planned:g} herbs{share}, {rate:.1f} herbs/min, ETA {eta} | "
+            f"pages {self.registry.total('terrapura_page_loads_total'):g}, fetch failures {failures:g}, "
+            f"GPT calls {self.registry.total('terrapura_gpt_calls_total'):g}, "
+            f"cache hits {self.registry.total('terrapura_gpt_cache_hits_total'):g}"
+        )
+
+    def tick(self):
+        if self.textfile:
+            try:
+                self.registry.write_textfile(self.textfile)
+            except OSError as e:
+                logging.warning(f"Could not write {self.textfile}: {e}")
+        else:
+            self.registry.collect()
+        logging.info(self.progress_line())
+
+    def run(self):
+        while not self._stopping.wait(self.interval):
+            self.tick()
+
+    def close(self):
+        self._stopping.set()
+        self.join()
+        self.tick()
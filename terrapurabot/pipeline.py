@@ -0,0 +1,239 @@
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import nullcontext
+
+from scrapper import (
+    PLANT_ALL_LINK,
+    SITE_MIN_INTERVAL,
+    count_fetch,
+    extract_or_reuse,
+    get_latin_name,
+    get_text_herbpathy,
+    get_text_pfaf,
+    get_text_webmd,
+    load_json,
+    new_driver,
+)
+from ai_extractor import pfaf_text_usable
+from metrics import metrics
+from throttle import SiteLimiter
+from worker_pool import ResultWriter
+
+# Bounded queues between stages: a slow stage fills its input queue and the stage before it blocks
+# instead of piling up herbs in memory.
+STAGE_QUEUE_SIZE = 8
+
+# Texts the fetchers store when a source could not be read; such a result is retried.
+FAILED_TEXTS = {" NO DATA FOUND", "Error: NO DATA FOUND", "Timeout or no content found."}
+
+
+class RetryPolicy:
+    def __init__(self, attempts=1, backoff=0.0):
+        self.attempts = attempts
+        self.backoff = backoff
+
+    def delay(self, attempt):
+        return self.backoff * 2 ** attempt
+
+
+class Stage:
+    """One step of the flow. `field` is its checkpoint in the record store: a herb that already
+    has it (per `done`, truthy by default) skips the stage. `run(driver, item)` returns the updates
+    to store (None on failure); `is_failure(updates)` flags results worth retrying."""
+
+    def __init__(self, name, field, run, workers=1, retry=None, site=None, done=None, is_failure=None):
+        self.name = name
+        self.field = field
+        self.run = run
+        self.done = done or (lambda view: bool(view.get(field)))
+        self.is_failure = is_failure or (lambda updates: False)
+        self.workers = workers
+        self.retry = retry or RetryPolicy()
+        self.site = site
+        self.queue = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
+        self.processed = 0
+        self.failed = 0
+
+
+class _Item:
+    def __init__(self, idx, plant, latin_name, entry):
+        self.idx = idx
+        self.plant = plant
+        self.latin_name = latin_name
+        self.view = dict(entry)
+
+
+# ------------------------- STAGES -------------------------
+
+def _fetch_stage(name, field, fetch, workers, retry):
+    def run(driver, item):
+        updates = {}
+        fetch(driver, item, updates)
+        if field in updates:
+            count_fetch(name, updates)
+        return updates
+
+    def is_failure(updates):
+        return updates.get(field) in FAILED_TEXTS
+
+    # Like the serial run, any stored result (even a failed one) counts as done on the next run.
+    return Stage(name, field, run, workers=workers, retry=retry, site=name, done=lambda view: field in view, is_failure=is_failure)
+
+
+def _extract(driver, item):
+    if not all(k in item.view for k in ["textwebmd", "textherbpathy", "textpfaf"]):
+        return {}
+    if not pfaf_text_usable(item.view):
+        # No retry can fix the PFAF text; retries (and their backoff) are for API errors.
+        logging.warning(f"[extract] {item.latin_name}: no usable PFAF text, not extracting.")
+        return {}
+    extracted, updates = extract_or_reuse(item.latin_name, item.view)
+    return dict(updates, _herb=extracted) if extracted else None
+
+
+def default_stages():
+    import scrapper  # EXTRACT_INLINE is read at run time: cli.py turns it off for --no-extract
+
+    def pfaf(driver, item, updates):
+        if item.plant.get("url"):
+            get_text_pfaf(driver, item.plant["url"], updates)
+
+    stages = [
+        _fetch_stage("webmd", "textwebmd", lambda d, item, u: get_text_webmd(d, item.latin_name, u),
+                     workers=2, retry=RetryPolicy(2, 10)),
+        _fetch_stage("herbpathy", "textherbpathy", lambda d, item, u: get_text_herbpathy(d, item.latin_name, u),
+                     workers=1, retry=RetryPolicy(2, 10)),
+        _fetch_stage("pfaf", "textpfaf", pfaf, workers=3, retry=RetryPolicy(3, 5)),
+    ]
+    if scrapper.EXTRACT_INLINE:
+        stages.append(Stage("extract", "extracted", _extract, workers=4, retry=RetryPolicy(3, 20)))
+    return stages
+
+
+# ------------------------- RUNNER -------------------------
+
+class Pipeline:
+    def __init__(self, stages, writer, limiter=None):
+        self.stages = stages
+        self.writer = writer
+        self.limiter = limiter or SiteLimiter(min_interval=SITE_MIN_INTERVAL)
+        self._remaining = {}
+        self._lock = threading.Lock()
+
+    def _process(self, stage, driver, item):
+        if stage.done(item.view):
+            return
+
+        updates = None
+        for attempt in range(stage.retry.attempts):
+            if attempt:
+                time.sleep(stage.retry.delay(attempt - 1))
+            try:
+                with self.limiter.slot(stage.site) if stage.site else nullcontext():
+                    updates = driver.step(lambda: stage.run(driver, item))
+            except Exception as e:
+                logging.error(f"[{stage.name}] {item.latin_name}: {e}")
+                updates = None
+            if updates is not None and not stage.is_failure(updates):
+                break
+            logging.warning(f"[{stage.name}] attempt {attempt + 1}/{stage.retry.attempts} failed for {item.latin_name}")
+
+        with self._lock:
+            stage.processed += 1
+            if updates is None or stage.is_failure(updates):
+                stage.failed += 1
+        if not updates:
+            return
+
+        # Fetch stages still record a failed result (e.g. " NO DATA FOUND"), as the serial run does.
+        herb = updates.pop("_herb", None)
+        item.view.update(updates)
+        self.writer.commit(item.latin_name, updates, extracted=herb)
+
+    def _worker(self, stage, next_stage):
+        # Chrome only starts if the stage uses it, so PFAF-over-HTTP and GPT workers never open one.
+        driver = new_driver(threading.current_thread().name)
+        try:
+            while True:
+                item = stage.queue.get()
+                if item is None:
+                    break
+                self._process(stage, driver, item)
+                if next_stage:
+                    next_stage.queue.put(item)  # blocks while the next stage is behind
+                else:
+                    metrics.inc("terrapura_herbs_done_total")
+        finally:
+            driver.quit()
+            with self._lock:
+                self._remaining[stage.name] -= 1
+                last = self._remaining[stage.name] == 0
+            if last and next_stage:
+                for _ in range(next_stage.workers):
+                    next_stage.queue.put(None)
+
+    def run(self, items):
+        threads = []
+        for i, stage in enumerate(self.stages):
+            next_stage = self.stages[i + 1] if i + 1 < len(self.stages) else None
+            self._remaining[stage.name] = stage.workers
+            for n in range(stage.workers):
+                threads.append(threading.Thread(target=self._worker, args=(stage, next_stage), name=f"{stage.name}-{n}"))
+        for t in threads:
+            t.start()
+
+        first = self.stages[0]
+        for item in items:
+            first.queue.put(item)
+        for _ in range(first.workers):
+            first.queue.put(None)
+
+        for t in threads:
+            t.join()
+        for stage in self.stages:
+            logging.info(f"Stage {stage.name}: {stage.processed} processed, {stage.failed} failed after retries")
+
+    def queue_depths(self):
+        return {stage.name: stage.queue.qsize() for stage in self.stages}
+
+    def export_queue_depths(self, registry):
+        for name, depth in self.queue_depths().items():
+            registry.set("terrapura_queue_depth", depth, queue=name)
+        registry.set("terrapura_queue_depth", self.writer.updates.qsize(), queue="writer")
+
+
+def load_plants():
+    """Link-discovery stage: its checkpoint is the plant list itself, harvested only when missing."""
+    plants = load_json(PLANT_ALL_LINK, default=[]) if os.path.exists(PLANT_ALL_LINK) else []
+    if not plants:
+        from get_all_link import LinkHarvester, write_link_index
+        logging.info("No plant list yet, harvesting PFAF links first.")
+        LinkHarvester().run()
+        write_link_index()
+        plants = load_json(PLANT_ALL_LINK, default=[])
+    return plants
+
+
+def run_pipeline(store, sink, stages=None):
+    plants = load_plants()
+    metrics.set("terrapura_herbs_planned", len(plants))
+
+    def items():
+        for idx, plant in enumerate(plants, 1):
+            latin_name = get_latin_name(plant)
+            if not latin_name:
+                logging.warning(f"Skipping entry with no Latin name at index {idx}")
+                continue
+            yield _Item(idx, plant, latin_name, store.get(latin_name))
+
+    writer = ResultWriter(store, sink)
+    writer.start()
+    pipeline = Pipeline(stages or default_stages(), writer)
+    metrics.add_collector(pipeline.export_queue_depths)
+    try:
+        pipeline.run(items())
+    finally:
+        writer.close()
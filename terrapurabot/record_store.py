@@ -0,0 +1,162 @@
+import glob
+import json
+import logging
+import os
+
+from file_lock import FileLock
+from herb_index import HerbIndex
+
+
+class RecordStore:
+    """Scraped herb records kept as a JSON snapshot plus an append-only journal.
+
+    Every field update is appended to the journal as one JSON line, so saving costs the size of
+    the update rather than the size of the whole catalogue. On start-up the snapshot is loaded and
+    the journal replayed on top of it; every `compact_every` updates the merged state is written
+    back to the snapshot (atomically) and the journal is emptied. The snapshot has exactly the
+    shape of the old `scraped_data_combined.json`.
+
+    With `read_only` nothing is written, not even a torn journal tail, so the files can be
+    inspected while a run is appending to them. Otherwise the store holds `<snapshot>.lock` while
+    open, so two runs (say the scraper and the extraction service) can never compact the same
+    journal under each other; the second one gets FileInUse.
+
+    With `worker` set (sharded runs, several processes on the same files), updates go to the
+    worker's own journal, `<snapshot>.<worker>.journal.jsonl`, and the snapshot is never rewritten.
+    Every store replays all worker journals on top of its own, `catch_up()` picks up what other
+    workers appended since, and compacting a store opened without `worker` folds the worker
+    journals into the snapshot and deletes them (only do that once every worker has stopped).
+    """
+
+    def __init__(self, snapshot_path, journal_path=None, compact_every=500, read_only=False, worker=None):
+        base = os.path.splitext(snapshot_path)[0]
+        self.snapshot_path = snapshot_path
+        self.main_journal_path = base + ".journal.jsonl"
+        self.journal_path = journal_path or (f"{base}.{worker}.journal.jsonl" if worker else self.main_journal_path)
+        self.compact_every = 0 if worker else compact_every
+        self.read_only = read_only
+        self.worker = worker
+        self.records = []
+        self.index = HerbIndex()
+        self._pending = 0
+        self._offsets = {}  # journal path -> bytes replayed so far
+        self._lock = None if read_only else FileLock(base + ".lock", shared=bool(worker))
+        self._load()
+        self._journal = None if read_only else open(self.journal_path, "a", encoding="utf-8")
+
+    # ---- loading ----
+
+    def _load(self):
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            snapshot = []
+        except json.JSONDecodeError:
+            logging.warning(f"Snapshot {self.snapshot_path} is unreadable, rebuilding from journal only.")
+            snapshot = []
+
+        for entry in snapshot:
+            if entry.get("latin_name"):
+                self._insert(entry)
+
+        self._pending = self._replay(self.journal_path)
+        replayed = self._pending + self.catch_up()
+        logging.info(f"Loaded {len(self.records)} records ({replayed} journal updates replayed).")
+
+    def _worker_journals(self):
+        base = os.path.splitext(self.snapshot_path)[0]
+        return sorted(glob.glob(glob.escape(base) + ".*.journal.jsonl"))
+
+    def catch_up(self):
+        """Replay whatever the other journals (other workers', or the main one) gained since last time."""
+        others = [self.main_journal_path] + self._worker_journals()
+        return sum(self._replay(path) for path in others if path != self.journal_path)
+
+    def _replay(self, path):
+        if not os.path.exists(path):
+            return 0
+
+        count = 0
+        start = good_bytes = self._offsets.get(path, 0)
+        with open(path, "rb") as f:
+            f.seek(start)
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                try:
+                    line = json.loads(raw)
+                except json.JSONDecodeError:
+                    break
+                self.get(line["latin_name"])[line["field"]] = line["value"]
+                good_bytes += len(raw)
+                count += 1
+
+        self._offsets[path] = good_bytes
+
+        # A crash mid-append leaves a torn last line; cut it off so new lines start clean. Another
+        # worker's journal may just be mid-append, so only our own is ever cut.
+        if path == self.journal_path and good_bytes < os.path.getsize(path) and not self.read_only:
+            logging.warning(f"Dropping torn tail of {path} after {count} updates.")
+            with open(path, "r+b") as f:
+                f.truncate(good_bytes)
+        return count
+
+    def _insert(self, entry):
+        self.records.append(entry)
+        self.index.add(entry)
+
+    # ---- access ----
+
+    def get(self, latin_name):
+        entry = self.index.get(latin_name)
+        if entry is None:
+            entry = {"latin_name": latin_name}
+            self._insert(entry)
+        return entry
+
+    def update(self, latin_name, updates):
+        if not updates:
+            return
+        if self.read_only:
+            raise RuntimeError(f"{self.snapshot_path} was opened read-only")
+        self.get(latin_name).update(updates)
+        for field, value in updates.items():
+            self._journal.write(json.dumps({"latin_name": latin_name, "field": field, "value": value}, ensure_ascii=False) + "\n")
+        self._journal.flush()
+
+        self._pending += len(updates)
+        if self.compact_every and self._pending >= self.compact_every:
+            self.compact()
+
+    # ---- snapshot / export ----
+
+    def export(self, file_path):
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.records, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+
+    def compact(self):
+        if self.worker:
+            return  # the snapshot is shared; merging is left to a store opened without `worker`
+        # Snapshot first, then truncate: if we die in between, replaying the journal again is harmless.
+        self.catch_up()
+        self.export(self.snapshot_path)
+        self._journal.seek(0)
+        self._journal.truncate()
+        self._offsets[self.journal_path] = 0
+        for path in self._worker_journals():
+            os.remove(path)
+            self._offsets.pop(path, None)
+        self._pending = 0
+
+    def close(self):
+        if self.read_only:
+            return
+        self.compact()
+        self._journal.close()
+        if self._lock:
+            self._lock.release()
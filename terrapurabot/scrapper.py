@@ -1,32 +1,97 @@
 import os
 import json
+import hashlib
+import argparse
+import threading
 import time
 import logging
-from typing import Dict
+from contextlib import nullcontext
 from urllib.parse import quote_plus, urlparse, parse_qs
 
 from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
-
-import undetected_chromedriver as uc
-from colorama import Fore, Style, init
-
-from ai_extractor import extract_herb_info_with_gpt
+from lxml import html as lxml_html
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from colorama import init
+
+from ai_extractor import extract_herb_info_with_gpt, get_response_cache, usage_summary
+from config import (
+    AI_EXTRACTED_FILE,
+    FETCH_FAILURES,
+    PLANT_ALL_LINK,
+    RETRYABLE_FETCH_FAILURES,
+    SCRAPED_COMBINED,
+    SOURCE_FIELDS,
+    WORK_QUEUE_FILE,
+)
+from dedup import DuplicateIndex, fingerprint
+from driver_manager import ManagedDriver
+from extracted_sink import ExtractedSink
+from file_lock import FileInUse
+from herb_index import parse_synonyms
+from html_archive import HtmlArchive
+from metrics import ProgressReporter, metrics
+from timing import LatencyTracker
+from record_store import RecordStore
+from work_queue import LeaseKeeper, WorkQueue, default_worker_id
+
+# Selenium's webdriver package, undetected_chromedriver and requests are imported where they are
+# first needed, so commands that never open a page (status, export, --replay) start quickly.
 
 # ------------------------- CONFIG -------------------------
 
 init(autoreset=True)
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-PLANT_ALL_LINK = "plant_all_link.json"
-SCRAPED_COMBINED = "scraped_data_combined.json"
-AI_EXTRACTED_FILE = "ai_extracted.json"
+# File names (PLANT_ALL_LINK, SCRAPED_COMBINED, AI_EXTRACTED_FILE, WORK_QUEUE_FILE) are set in config.py.
 HEADLESS_MODE = True
 WAIT_TIME = 10
+# Field updates go to an append-only journal; this many updates are folded back into SCRAPED_COMBINED at a time.
+COMPACT_EVERY = 500
+
+# Pool mode: run this many isolated Chrome drivers side by side (0 or 1 keeps the single-driver run).
+POOL_WORKERS = 0
+# Per-site caps so each host only ever sees a few workers at once, and a polite gap between their requests.
+SITE_CONCURRENCY = {"webmd": 2, "herbpathy": 1, "pfaf": 2}
+SITE_MIN_INTERVAL = {"webmd": 1.0, "herbpathy": 1.5, "pfaf": 1.0}
+# PFAF pages are fetched over plain HTTP first (pooled session, one lxml parse); Chrome only as a fallback.
+PFAF_HTTP_TIMEOUT = 20
+HTTP_USER_AGENT = "Mozilla/5.0"
+# Selenium waits start at these defaults, then follow observed latency (p99 x LATENCY_MARGIN).
+WEBMD_SEARCH_WAIT = 6
+# Shown instead of a result list when a WebMD search finds nothing; ends the search wait early.
+WEBMD_NO_RESULTS_SELECTOR = ".search-results-no-results, .no-results"
+WEBMD_MONOGRAPH_WAIT = 5
+PFAF_PAGE_WAIT = 10
+LATENCY_MARGIN = 1.5
+# Every fetched page is kept (gzip, content-addressed) so parsing can be re-run offline with --replay.
+ARCHIVE_PAGES = True
+ARCHIVE_DIR = "html_archive"
+# Pipeline mode: separate stages (WebMD, Herbpathy, PFAF, GPT) joined by bounded queues, each with its
+# own workers and retries, so fetching and extraction overlap. Stage settings live in pipeline.py.
+PIPELINE_MODE = False
+# Set to False to only scrape here and leave GPT extraction to `python async_extractor.py`.
+EXTRACT_INLINE = True
+# Prometheus metrics: rewritten every METRICS_INTERVAL seconds (for node_exporter's textfile collector,
+# None to skip) and served on METRICS_PORT (0 to skip); a progress/ETA line is logged at the same pace.
+METRICS_FILE = "metrics.prom"
+METRICS_PORT = 0
+METRICS_INTERVAL = 60
+# Reuse the extraction of a herb whose sources are the same or nearly so (synonyms, subspecies)
+# instead of paying for two more GPT calls. See dedup.py for the thresholds.
+DEDUP_SOURCES = True
+# --refresh: re-check every source last checked more than this many days ago (PFAF with a conditional
+# request, the others by content hash) and re-extract only the herbs whose source text changed.
+REFRESH_AFTER_DAYS = 30
+# Chrome grows over thousands of pages: each driver is replaced after this many page loads or once its
+# processes use more than this much memory (0 disables either limit). A crashed driver is always replaced.
+DRIVER_MAX_PAGES = 500
+DRIVER_MAX_RSS_MB = 1500
+# --shard: several scrapper processes (on one host, or on several sharing this directory) split the plant
+# list through a SQLite lease queue (WORK_QUEUE_FILE). Each writes its own journal and log files;
+# `cli.py export` merges them.
+WORKER_ID = None  # default <hostname>-<pid>
+LEASE_SECONDS = 300
+LEASE_MAX_ATTEMPTS = 3
 
 # ------------------------- UTILITIES -------------------------
 
@@ -42,35 +107,90 @@ def save_json(file_path, data):
     with open(file_path, "w", encoding="utf-8") as f:
         json.dump(data, f, indent=2, ensure_ascii=False)
 
+def save_result(store, sink, latin_name, updates, extracted=None):
+    if extracted:
+        sink.add(extracted, latin_name)
+    store.update(latin_name, updates)
+
+def reconcile_extracted(store, sink, latin_names=None):
+    # The sink buffers a few herbs before writing; if a crash lost them, extract those herbs again.
+    entries = store.records if latin_names is None else [store.get(name) for name in latin_names]
+    for entry in entries:
+        if entry.get("extracted") and not sink.has(entry["latin_name"]):
+            store.update(entry["latin_name"], {"extracted": False})
+
+_archive = None
+latency = LatencyTracker(margin=LATENCY_MARGIN)
+
+def _export_latency(registry):
+    for (site, step), (counts, total, timeouts) in latency.snapshot().items():
+        if sum(counts):
+            registry.set_histogram("terrapura_step_seconds", counts, total, sum(counts), site=site, step=step)
+        if timeouts:
+            registry.set("terrapura_wait_timeouts_total", timeouts, site=site, step=step)
+
+metrics.describe("terrapura_wait_timeouts_total", "counter", "Selenium waits that timed out, by site/step.")
+metrics.add_collector(_export_latency)
+
+def count_fetch(site, updates):
+    outcome = FETCH_FAILURES.get(updates.get(SOURCE_FIELDS[site]), "ok")
+    metrics.inc("terrapura_fetch_results_total", site=site, outcome=outcome)
+
+def wait_for(driver, site, step, default, condition):
+    """WebDriverWait with a timeout sized from this step's observed latency; records the time it took."""
+    from selenium.webdriver.support.ui import WebDriverWait
+    timeout = latency.timeout(site, step, default)
+    start = time.perf_counter()
+    try:
+        result = WebDriverWait(driver, timeout).until(condition)
+    except TimeoutException:
+        latency.record_timeout(site, step, timeout)
+        raise
+    latency.record(site, step, time.perf_counter() - start)
+    return result
+
+def load_page(driver, site, url):
+    metrics.inc("terrapura_page_loads_total", site=site, via="browser")
+    with latency.timed(site, "load"):
+        driver.get(url)
 
-
-def save_extracted_herb(data: Dict, output_file: str):
+def archive_page(kind, latin_name, url, page_html):
+    global _archive
+    if not ARCHIVE_PAGES:
+        return
+    if _archive is None:
+        _archive = HtmlArchive(ARCHIVE_DIR)
     try:
-        existing_data = load_json(output_file, default=[])
-        existing_data.append(data)
-        save_json(output_file, existing_data)
-    except Exception as e:
-        logging.error(f"Error saving extracted herb to {output_file}: {e}")
+        _archive.capture(kind, latin_name, url, page_html)
+    except OSError as e:
+        logging.warning(f"Could not archive {url}: {e}")
 
-def get_entry(results, latin_name):
-    for entry in results:
-        if entry.get("latin_name") == latin_name:
-            return entry
-    entry = {"latin_name": latin_name}
-    results.append(entry)
-    return entry
+# uc.Chrome patches the shared chromedriver binary on start-up, so drivers are launched one at a time.
+_driver_start_lock = threading.Lock()
 
 def get_driver(headless=True):
+    import undetected_chromedriver as uc
     options = uc.ChromeOptions()
     if headless:
         options.add_argument("--headless=new")
     options.add_argument("--blink-settings=imagesEnabled=false")
-    return uc.Chrome(options=options)
+    metrics.inc("terrapura_driver_starts_total")
+    with _driver_start_lock:
+        return uc.Chrome(options=options)
+
+def new_driver(name="driver"):
+    """A ManagedDriver: Chrome starts on first use and is recycled or respawned as needed."""
+    return ManagedDriver(lambda: get_driver(headless=HEADLESS_MODE), DRIVER_MAX_PAGES, DRIVER_MAX_RSS_MB, name)
 
 # ------------------------- SCRAPERS -------------------------
 
-def extract_detail_text(driver):
-    soup = BeautifulSoup(driver.page_source, "html.parser")
+def extract_detail_text(driver, latin_name=""):
+    page_html = driver.page_source
+    archive_page("webmd_monograph", latin_name, driver.current_url, page_html)
+    return parse_webmd_html(page_html)
+
+def parse_webmd_html(page_html):
+    soup = BeautifulSoup(page_html, "html.parser")
     monograph = soup.select_one("#monograph-page")
     if not monograph:
         return ""
@@ -80,22 +200,31 @@ def extract_detail_text(driver):
     return monograph.get_text(separator="\n", strip=True)
 
 def get_text_webmd(driver, latin_name, entry):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
     search_url = f"https://www.webmd.com/vitamins-supplements/search?type=vitamins&query={quote_plus(latin_name)}"
     logging.info(f"Searching WebMD for {latin_name}")
     try:
-        driver.get(search_url)
-        WebDriverWait(driver, 6).until(EC.any_of(EC.url_contains("ingredientmono-")))
+        load_page(driver, "webmd", search_url)
+        # WebMD either redirects straight to the monograph, shows a list of results or says it found none.
+        wait_for(driver, "webmd", "search", WEBMD_SEARCH_WAIT, EC.any_of(
+            EC.url_contains("ingredientmono-"),
+            EC.presence_of_element_located((By.CSS_SELECTOR, "a.search-results-doc-title")),
+            EC.presence_of_element_located((By.CSS_SELECTOR, WEBMD_NO_RESULTS_SELECTOR)),
+        ))
 
         if "ingredientmono-" in driver.current_url:
-            entry["textwebmd"] = extract_detail_text(driver)
+            entry["textwebmd"] = extract_detail_text(driver, latin_name)
             return
 
-        soup = BeautifulSoup(driver.page_source, "html.parser")
+        page_html = driver.page_source
+        archive_page("webmd_search", latin_name, driver.current_url, page_html)
+        soup = BeautifulSoup(page_html, "html.parser")
         result = soup.select_one("a.search-results-doc-title")
         if result and result.get("href"):
-            driver.get("https://www.webmd.com" + result["href"])
-            WebDriverWait(driver, 5).until(EC.presence_of_element_located((By.CSS_SELECTOR, "#monograph-page")))
-            entry["textwebmd"] = extract_detail_text(driver)
+            load_page(driver, "webmd", "https://www.webmd.com" + result["href"])
+            wait_for(driver, "webmd", "monograph", WEBMD_MONOGRAPH_WAIT, EC.presence_of_element_located((By.CSS_SELECTOR, "#monograph-page")))
+            entry["textwebmd"] = extract_detail_text(driver, latin_name)
         else:
             entry["textwebmd"] = "No relevant content found."
     except TimeoutException:
@@ -103,92 +232,533 @@ def get_text_webmd(driver, latin_name, entry):
     except Exception as e:
         entry["textwebmd"] = " NO DATA FOUND"
 
-def get_text_herbpathy(driver, latin_name, entry):
-    logging.info(f"Searching Herbpathy for {latin_name}")
-    try:
-        driver.get("https://herbpathy.com/")
-        WebDriverWait(driver, WAIT_TIME).until(EC.presence_of_element_located((By.ID, "TextTitle")))
-        driver.execute_script("ChangeTab(2);")
+class HerbpathySession:
+    """Keeps a driver parked on Herbpathy's search tab so back-to-back searches skip the home-page load.
+
+    The page is only re-opened when it is no longer in a usable state (navigated away, search box
+    gone, or the previous search failed).
+    """
+
+    URL = "https://herbpathy.com/"
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.valid = False
+
+    def _search_box(self):
+        from selenium.webdriver.common.by import By
+        if not self.valid or not self.driver.current_url.startswith(self.URL):
+            return None
+        try:
+            boxes = self.driver.find_elements(By.ID, "TextTitle")
+            if not boxes:
+                return None
+            if not boxes[0].is_displayed():
+                self.driver.execute_script("ChangeTab(2);")
+            return boxes[0] if boxes[0].is_displayed() else None
+        except WebDriverException:
+            return None
+
+    def _open(self):
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        load_page(self.driver, "herbpathy", self.URL)
+        wait_for(self.driver, "herbpathy", "home", WAIT_TIME, EC.presence_of_element_located((By.ID, "TextTitle")))
+        self.driver.execute_script("ChangeTab(2);")
+        return wait_for(self.driver, "herbpathy", "tab", WAIT_TIME, EC.presence_of_element_located((By.ID, "TextTitle")))
+
+    def search(self, latin_name):
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        search_input = self._search_box() or self._open()
+        self.valid = False
+
+        previous = self.driver.find_elements(By.CSS_SELECTOR, "#div_contnt")
+        previous_text = previous[0].text if previous else None
 
-        search_input = WebDriverWait(driver, WAIT_TIME).until(EC.presence_of_element_located((By.ID, "TextTitle")))
         search_input.clear()
         search_input.send_keys(latin_name)
-        WebDriverWait(driver, WAIT_TIME).until(EC.element_to_be_clickable((By.ID, "Button1"))).click()
+        wait_for(self.driver, "herbpathy", "button", WAIT_TIME, EC.element_to_be_clickable((By.ID, "Button1"))).click()
+
+        def new_results(driver):
+            # A postback replaces the element, an in-place update changes its text; either means fresh results.
+            found = driver.find_elements(By.CSS_SELECTOR, "#div_contnt")
+            if not found:
+                return False
+            if previous and found[0] == previous[0] and found[0].text == previous_text:
+                return False
+            return found[0]
 
-        content = WebDriverWait(driver, WAIT_TIME).until(EC.presence_of_element_located((By.CSS_SELECTOR, "#div_contnt")))
-        entry["textherbpathy"] = content.text
+        wait_for(self.driver, "herbpathy", "results", WAIT_TIME, new_results)
+        self.valid = True
+        return self.driver.page_source
+
+def get_text_herbpathy(driver, latin_name, entry):
+    logging.info(f"Searching Herbpathy for {latin_name}")
+    # Kept on the ManagedDriver, which drops it when Chrome is recycled.
+    session = driver.sessions.get("herbpathy")
+    if session is None:
+        session = driver.sessions["herbpathy"] = HerbpathySession(driver)
+    try:
+        page_html = session.search(latin_name)
+        archive_page("herbpathy", latin_name, driver.current_url, page_html)
+        entry["textherbpathy"] = parse_herbpathy_html(page_html)
     except Exception as e:
         entry["textherbpathy"] = " NO DATA FOUND"
 
-def get_element_text(driver, xpath):
-    return ' '.join(el.text.strip() for el in driver.find_elements(By.XPATH, xpath) if el.text.strip())
+def parse_herbpathy_html(page_html):
+    content = BeautifulSoup(page_html, "html.parser").select_one("#div_contnt")
+    if content is None:
+        raise ValueError("no #div_contnt on Herbpathy page")
+    return content.get_text(separator="\n", strip=True)
+
+PFAF_FIELD_IDS = [
+    "ContentPlaceHolder1_lbldisplatinname",
+    "ContentPlaceHolder1_lblCommanName",
+    "ContentPlaceHolder1_lblFamily",
+    "ContentPlaceHolder1_lblUSDAhardiness",
+    "ContentPlaceHolder1_lblKnownHazards",
+    "ContentPlaceHolder1_txtHabitats",
+    "ContentPlaceHolder1_lblRange",
+    "ContentPlaceHolder1_lblWeedPotential",
+    "ContentPlaceHolder1_lblSynonyms",
+    "ContentPlaceHolder1_lblhabitats",
+    "ContentPlaceHolder1_txtEdibleUses",
+    "ContentPlaceHolder1_txtMediUses",
+    "ContentPlaceHolder1_txtOtherUses",
+    "ContentPlaceHolder1_txtSpecialUses",
+    "ContentPlaceHolder1_txtCultivationDetails",
+]
+PFAF_SYNONYMS = PFAF_FIELD_IDS.index("ContentPlaceHolder1_lblSynonyms")
+
+_http_session = None
+
+def get_http_session():
+    global _http_session
+    if _http_session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        session.headers["User-Agent"] = HTTP_USER_AGENT
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(POOL_WORKERS, 4))
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _http_session = session
+    return _http_session
+
+def _element_text(element):
+    # Match what Selenium's .text gives: <br> becomes a line break, runs of spaces collapse.
+    for br in element.iter("br"):
+        br.tail = "\n" + (br.tail or "")
+    lines = (" ".join(line.split()) for line in element.text_content().splitlines())
+    return "\n".join(line for line in lines if line)
+
+def parse_pfaf_html(page_html):
+    """All PFAF fields from one lxml parse, or None if this is not a plant page."""
+    tree = lxml_html.fromstring(page_html)
+    wanted = set(PFAF_FIELD_IDS)
+    found = {}
+    for element in tree.iter():
+        element_id = element.get("id")
+        if element_id in wanted:
+            found.setdefault(element_id, []).append(element)
+    if PFAF_FIELD_IDS[0] not in found:
+        return None
+    return [
+        " ".join(text for text in (_element_text(el) for el in found.get(field_id, [])) if text)
+        for field_id in PFAF_FIELD_IDS
+    ]
+
+def fetch_pfaf_http(url):
+    try:
+        metrics.inc("terrapura_page_loads_total", site="pfaf", via="http")
+        with latency.timed("pfaf", "http"):
+            response = get_http_session().get(url, timeout=PFAF_HTTP_TIMEOUT)
+        response.raise_for_status()
+        archive_page("pfaf", get_latin_name({"url": url}), url, response.content)
+        with latency.timed("pfaf", "parse"):
+            return parse_pfaf_html(response.content)
+    except Exception as e:
+        logging.warning(f"PFAF fast path failed for {url}: {e}")
+        return None
+
+def fetch_pfaf_conditional(url, validators):
+    """PFAF page over HTTP, only if it changed since `validators` ({"etag", "last_modified"} from the last fetch).
+
+    Returns (texts, validators), with texts None when the server answered 304 Not Modified.
+    Raises if the page could not be fetched or parsed, so the caller can fall back to the browser.
+    """
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    metrics.inc("terrapura_page_loads_total", site="pfaf", via="http")
+    with latency.timed("pfaf", "http"):
+        response = get_http_session().get(url, headers=headers, timeout=PFAF_HTTP_TIMEOUT)
+    if response.status_code == 304:
+        return None, validators
+    response.raise_for_status()
+    archive_page("pfaf", get_latin_name({"url": url}), url, response.content)
+    texts = parse_pfaf_html(response.content)
+    if texts is None:
+        raise ValueError("not a PFAF plant page")
+    validators = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+    return texts, {k: v for k, v in validators.items() if v}
+
+def fetch_pfaf_browser(driver, url):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    load_page(driver, "pfaf", url)
+    wait_for(driver, "pfaf", "page", PFAF_PAGE_WAIT, EC.presence_of_element_located((By.ID, PFAF_FIELD_IDS[0])))
+    page_html = driver.page_source
+    archive_page("pfaf", get_latin_name({"url": url}), url, page_html)
+    # Same single parse as the fast path instead of one WebDriver round-trip per field.
+    return parse_pfaf_html(page_html) or [""] * len(PFAF_FIELD_IDS)
 
 def get_text_pfaf(driver, url, entry):
     logging.info(f"Scraping PFAF: {url}")
     try:
-        driver.get(url)
-        time.sleep(2)
-        xpaths = [
-            '//*[@id="ContentPlaceHolder1_lbldisplatinname"]',
-            '//*[@id="ContentPlaceHolder1_lblCommanName"]',
-            '//*[@id="ContentPlaceHolder1_lblFamily"]',
-            '//*[@id="ContentPlaceHolder1_lblUSDAhardiness"]',
-            '//*[@id="ContentPlaceHolder1_lblKnownHazards"]',
-            '//*[@id="ContentPlaceHolder1_txtHabitats"]',
-            '//*[@id="ContentPlaceHolder1_lblRange"]',
-            '//*[@id="ContentPlaceHolder1_lblWeedPotential"]',
-            '//*[@id="ContentPlaceHolder1_lblSynonyms"]',
-            '//*[@id="ContentPlaceHolder1_lblhabitats"]',
-            '//*[@id="ContentPlaceHolder1_txtEdibleUses"]',
-            '//*[@id="ContentPlaceHolder1_txtMediUses"]',
-            '//*[@id="ContentPlaceHolder1_txtOtherUses"]',
-            '//*[@id="ContentPlaceHolder1_txtSpecialUses"]',
-            '//*[@id="ContentPlaceHolder1_txtCultivationDetails"]',
-        ]
-        entry["textpfaf"] = "\n\n".join(get_element_text(driver, xpath) for xpath in xpaths)
+        # PFAF pages are server-rendered, so a plain HTTP fetch usually does; the browser is the fallback.
+        texts = fetch_pfaf_http(url)
+        if texts is None:
+            logging.info(f"Falling back to the browser for {url}")
+            texts = fetch_pfaf_browser(driver, url)
+        entry["textpfaf"] = "\n\n".join(texts)
+        entry["synonyms"] = parse_synonyms(texts[PFAF_SYNONYMS])
     except Exception as e:
         entry["textpfaf"] = "Error: NO DATA FOUND"
 
 # ------------------------- MAIN -------------------------
 
-def main():
-    plants = load_json(PLANT_ALL_LINK, default=[])
-    results = load_json(SCRAPED_COMBINED, default=[])
-
-    with get_driver(headless=HEADLESS_MODE) as driver:
+def get_latin_name(plant):
+    query = urlparse(plant.get("url", "")).query
+    return parse_qs(query).get("LatinName", [""])[0]
+
+duplicates = DuplicateIndex()
+
+def load_duplicates(store, sink):
+    # Herbs extracted before fingerprints (or their PFAF part) were kept get one now.
+    for latin_name, fp in duplicates.load(store, sink).items():
+        store.update(latin_name, {"fingerprint": fp})
+
+def extract_or_reuse(latin_name, view):
+    """(herb, store updates) for a fully scraped herb, or (None, None) if extraction failed."""
+    fp = fingerprint(view) if DEDUP_SOURCES else None
+    reused = duplicates.reuse(latin_name, fp) if fp else None
+    if reused:
+        return reused
+
+    with latency.timed("gpt", "extract"):
+        herb = extract_herb_info_with_gpt(view)
+    if not herb:
+        return None, None
+    updates = {"extracted": True}
+    if fp:
+        duplicates.add(latin_name, fp, herb)
+        updates["fingerprint"] = fp
+    return herb, updates
+
+def process_plant(driver, plant, latin_name, entry, commit, limiter=None):
+    """Fetch whatever is still missing for one plant and hand every result to `commit`.
+
+    `driver` is a ManagedDriver (see new_driver). `entry` is only read here; all writes go through `commit(latin_name, updates, extracted=None)`
+    so that pool mode can funnel them into a single writer.
+    """
+    view = dict(entry)
+
+    def fetch(site, fetcher, target):
+        updates = {}
+        with limiter.slot(site) if limiter else nullcontext():
+            driver.step(lambda: fetcher(driver, target, updates))
+        count_fetch(site, updates)
+        view.update(updates)
+        commit(latin_name, updates)
+
+    if "textwebmd" not in view:
+        fetch("webmd", get_text_webmd, latin_name)
+
+    if "textherbpathy" not in view:
+        fetch("herbpathy", get_text_herbpathy, latin_name)
+
+    if "textpfaf" not in view and plant.get("url"):
+        fetch("pfaf", get_text_pfaf, plant["url"])
+
+    if EXTRACT_INLINE and all(k in view for k in ["textwebmd", "textherbpathy", "textpfaf"]) and not view.get("extracted"):
+        logging.info(f"Extracting herb info with GPT for {latin_name}...")
+        extracted, updates = extract_or_reuse(latin_name, view)
+        if extracted:
+            commit(latin_name, updates, extracted=extracted)
+            logging.info("GPT extraction saved.")
+
+def run_serial(plants, store, sink):
+    def commit(latin_name, updates, extracted=None):
+        save_result(store, sink, latin_name, updates, extracted)
+
+    with new_driver("serial") as driver:
         for idx, plant in enumerate(plants, 1):
-            query = urlparse(plant.get("url", "")).query
-            latin_name = parse_qs(query).get("LatinName", [""])[0]
+            latin_name = get_latin_name(plant)
             if not latin_name:
                 logging.warning(f"Skipping entry with no Latin name at index {idx}")
                 continue
 
             logging.info(f"[{idx}/{len(plants)}] Processing: {latin_name}")
-            entry = get_entry(results, latin_name)
-
-            if "textwebmd" not in entry:
-                get_text_webmd(driver, latin_name, entry)
-                save_json(SCRAPED_COMBINED, results)
-
-            if "textherbpathy" not in entry:
-                get_text_herbpathy(driver, latin_name, entry)
-                save_json(SCRAPED_COMBINED, results)
+            process_plant(driver, plant, latin_name, store.get(latin_name), commit)
+            metrics.inc("terrapura_herbs_done_total")
+
+def replay_archive(store):
+    """Re-run the parsers over the latest archived page of each herb and source, without any network."""
+    def pfaf_updates(page_html):
+        texts = parse_pfaf_html(page_html)
+        return {"textpfaf": "\n\n".join(texts), "synonyms": parse_synonyms(texts[PFAF_SYNONYMS])} if texts else {}
+
+    parsers = {
+        "webmd_monograph": lambda page_html: {"textwebmd": parse_webmd_html(page_html)},
+        "herbpathy": lambda page_html: {"textherbpathy": parse_herbpathy_html(page_html)},
+        "pfaf": pfaf_updates,
+    }
+
+    archive = HtmlArchive(ARCHIVE_DIR)
+    parsed = changed = 0
+    for (latin_name, kind), capture in archive.latest().items():
+        if kind not in parsers or not latin_name:
+            continue
+        try:
+            updates = parsers[kind](archive.load(capture["sha256"]))
+        except Exception as e:
+            logging.warning(f"Could not re-parse {kind} page for {latin_name}: {e}")
+            continue
+        parsed += 1
+
+        entry = store.get(latin_name)
+        updates = {k: v for k, v in updates.items() if entry.get(k) != v}
+        if updates:
+            # The source text changed, so the GPT extraction made from it is stale.
+            updates["extracted"] = False
+            store.update(latin_name, updates)
+            changed += 1
+
+    logging.info(f"Replay: re-parsed {parsed} archived pages, {changed} changed a record.")
+
+metrics.describe("terrapura_refresh_results_total", "counter",
+                 "Sources re-checked by --refresh, by site and outcome (not_modified, unchanged, changed, failed).")
+
+def text_sha256(text):
+    # Whitespace is normalized, so a text read with other line breaks (Selenium's .text vs lxml) still matches.
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+def refresh_plant(driver, plant, latin_name, entry, commit):
+    """Re-fetch the sources of one herb that are due for a check; re-extract it if any source text changed.
+
+    What was last seen of each source is kept in the record under "sources_checked"
+    ({site: {"checked_at", "sha256", and for PFAF "etag"/"last_modified"}}). A failed fetch (timeout
+    or error) keeps the old text and is retried on the next refresh; "No relevant content found."
+    counts as a result like any other text.
+    """
+    view = dict(entry)
+    checked = {site: dict(seen) for site, seen in (view.get("sources_checked") or {}).items()}
+    due_before = time.time() - REFRESH_AFTER_DAYS * 86400
+    changed = {}
+    fetchers = {"webmd": get_text_webmd, "herbpathy": get_text_herbpathy}
+
+    for site, field in SOURCE_FIELDS.items():
+        seen = checked.get(site, {})
+        # Sources never fetched are left to the normal scrape; failed ones are retried here.
+        if field not in view or seen.get("checked_at", 0) > due_before:
+            continue
+        # Hashed from the stored text rather than taken from "sources_checked", so records hashed
+        # before whitespace was normalized are not all seen as changed.
+        old_sha = text_sha256(view[field])
+        fresh, validators = {}, {}
+        if site == "pfaf":
+            if not plant.get("url"):
+                continue
+            try:
+                texts, validators = fetch_pfaf_conditional(plant["url"], seen)
+            except Exception as e:
+                logging.warning(f"Conditional PFAF fetch failed for {latin_name}: {e}")
+                driver.step(lambda: get_text_pfaf(driver, plant["url"], fresh))
+            else:
+                if texts is None:
+                    checked[site] = dict(seen, checked_at=time.time(), sha256=old_sha)
+                    metrics.inc("terrapura_refresh_results_total", site=site, outcome="not_modified")
+                    continue
+                fresh = {"textpfaf": "\n\n".join(texts), "synonyms": parse_synonyms(texts[PFAF_SYNONYMS])}
+        else:
+            driver.step(lambda: fetchers[site](driver, latin_name, fresh))
+
+        text = fresh.get(field)
+        if text is None or FETCH_FAILURES.get(text) in RETRYABLE_FETCH_FAILURES:
+            metrics.inc("terrapura_refresh_results_total", site=site, outcome="failed")
+            continue
+        sha = text_sha256(text)
+        checked[site] = dict(validators, checked_at=time.time(), sha256=sha)
+        outcome = "unchanged" if sha == old_sha else "changed"
+        metrics.inc("terrapura_refresh_results_total", site=site, outcome=outcome)
+        if outcome == "changed":
+            logging.info(f"{site} text changed for {latin_name}")
+            changed.update(fresh)
+
+    updates = {"sources_checked": checked} if checked != view.get("sources_checked", {}) else {}
+    if changed:
+        # The source text changed, so the GPT extraction made from it is stale.
+        updates.update(changed, extracted=False)
+    if not updates:
+        return False
+    view.update(updates)
+    commit(latin_name, updates)
+
+    if changed and EXTRACT_INLINE and all(field in view for field in SOURCE_FIELDS.values()):
+        logging.info(f"Re-extracting herb info with GPT for {latin_name}...")
+        extracted, updates = extract_or_reuse(latin_name, view)
+        if extracted:
+            commit(latin_name, updates, extracted=extracted)
+    return bool(changed)
+
+def run_refresh(plants, store, sink):
+    def commit(latin_name, updates, extracted=None):
+        save_result(store, sink, latin_name, updates, extracted)
+
+    # Chrome is only started once a WebMD/Herbpathy check (or a PFAF fallback) needs it.
+    changed = 0
+    with new_driver("refresh") as driver:
+        for idx, plant in enumerate(plants, 1):
+            latin_name = get_latin_name(plant)
+            if latin_name:
+                logging.info(f"[{idx}/{len(plants)}] Refreshing: {latin_name}")
+                changed += refresh_plant(driver, plant, latin_name, store.get(latin_name), commit)
+            metrics.inc("terrapura_herbs_done_total")
+    logging.info(f"Refresh: {changed} herbs had changed sources.")
+
+def active_shard_workers():
+    if not os.path.exists(WORK_QUEUE_FILE):
+        return []
+    queue = WorkQueue(WORK_QUEUE_FILE)
+    try:
+        return queue.active_workers()
+    finally:
+        queue.close()
+
+def open_data_stores(worker=None, prepare=True):
+    """(store, sink) over SCRAPED_COMBINED and AI_EXTRACTED_FILE, or None (reason logged) if the run must not start.
+
+    Outside shard mode (no `worker`), closing them folds the shard workers' journals and logs into the
+    main files and deletes them, so that is refused while workers hold leases; the file locks keep two
+    such runs apart. With `prepare`, herbs whose extraction was lost are queued again and the
+    duplicate index is loaded.
+    """
+    running = [] if worker else active_shard_workers()
+    if running:
+        logging.error(f"Shard workers are running ({', '.join(running)}); wait for them to finish (or scrape with --shard).")
+        return None
+    try:
+        store = RecordStore(SCRAPED_COMBINED, compact_every=COMPACT_EVERY, worker=worker)
+    except FileInUse as e:
+        logging.error(f"{e}. Only one scrape, extraction or export run can use these files at a time.")
+        return None
+    try:
+        sink = ExtractedSink(AI_EXTRACTED_FILE, worker=worker)
+    except FileInUse as e:
+        store.close()
+        logging.error(f"{e}. Only one scrape, extraction or export run can use these files at a time.")
+        return None
+    if prepare:
+        if not worker:
+            reconcile_extracted(store, sink)  # sharded runs do this per herb, as they claim it
+        if DEDUP_SOURCES:
+            load_duplicates(store, sink)
+    return store, sink
+
+def run_sharded(plants, store, sink, worker):
+    """Claim herbs from the shared work queue, one lease at a time, until none are left."""
+    queue = WorkQueue(WORK_QUEUE_FILE, max_attempts=LEASE_MAX_ATTEMPTS)
+    added = queue.fill(plants, get_latin_name)
+    logging.info(f"Worker {worker}: {added} plants newly queued in {WORK_QUEUE_FILE}, queue now {queue.counts()}")
+    keeper = LeaseKeeper(queue, worker, LEASE_SECONDS)
+    keeper.start()
+
+    def commit(latin_name, updates, extracted=None):
+        save_result(store, sink, latin_name, updates, extracted)
 
-            if "textpfaf" not in entry and plant.get("url"):
-                get_text_pfaf(driver, plant["url"], entry)
-                save_json(SCRAPED_COMBINED, results)
+    try:
+        with new_driver(worker) as driver:
+            while True:
+                job = queue.claim(worker, LEASE_SECONDS)
+                if job is None:
+                    break
+                idx, plant = job
+                latin_name = get_latin_name(plant)
+                logging.info(f"[{worker}] [{idx}/{len(plants)}] Processing: {latin_name}")
+                # The herb may have been started by a worker whose lease ran out; pick up what it saved.
+                store.catch_up()
+                sink.catch_up()
+                reconcile_extracted(store, sink, [latin_name])
+                try:
+                    process_plant(driver, plant, latin_name, store.get(latin_name), commit)
+                    sink.flush(sync=True)  # before the herb is marked done, so a crash cannot lose its extraction
+                except Exception as e:
+                    logging.error(f"[{worker}] Failed on {latin_name}: {e}")
+                    queue.finish(worker, latin_name, ok=False)
+                else:
+                    if not queue.finish(worker, latin_name):
+                        logging.warning(f"[{worker}] Lease on {latin_name} ran out before it was done; another worker took it over.")
+                metrics.inc("terrapura_herbs_done_total")
+    finally:
+        keeper.close()
+        queue.release(worker)
+        queue.close()
+
+def main(replay=False, refresh=False, shard=False):
+    worker = (WORKER_ID or default_worker_id()) if shard else None
+    if shard:
+        import ai_extractor
+        ai_extractor.CACHE_WAL = False  # the reply cache is shared with workers on other hosts
+    stores = open_data_stores(worker)
+    if stores is None:
+        return
+    store, sink = stores
 
-            if all(k in entry for k in ["textwebmd", "textherbpathy", "textpfaf"]) and not entry.get("extracted"):
-                logging.info("Extracting herb info with GPT...")
-                extracted = extract_herb_info_with_gpt(entry)
-                if extracted:
-                    save_extracted_herb(extracted, AI_EXTRACTED_FILE)
-                    entry["extracted"] = True
-                    save_json(SCRAPED_COMBINED, results)
-                    logging.info("GPT extraction saved.")
+    plants = load_json(PLANT_ALL_LINK, default=[])
+    metrics_file = METRICS_FILE
+    if shard:
+        metrics.labels["worker"] = worker
+        metrics_file = METRICS_FILE and f"{os.path.splitext(METRICS_FILE)[0]}.{worker}.prom"
+    metrics.set("terrapura_herbs_planned", len(plants))
+    reporter = ProgressReporter(interval=METRICS_INTERVAL, textfile=metrics_file)
+    server = metrics.serve(METRICS_PORT) if METRICS_PORT else None
+    reporter.start()
+    try:
+        if replay:
+            replay_archive(store)
+        elif refresh:
+            run_refresh(plants, store, sink)
+        elif shard:
+            run_sharded(plants, store, sink, worker)
+        elif PIPELINE_MODE:
+            from pipeline import run_pipeline
+            run_pipeline(store, sink)
+        elif POOL_WORKERS > 1:
+            from worker_pool import run_pool
+            run_pool(plants, store, sink, POOL_WORKERS)
+        else:
+            run_serial(plants, store, sink)
+    finally:
+        sink.close()
+        store.close()
+        reporter.close()
+        if server:
+            server.shutdown()
+        logging.info(get_response_cache().summary())
+        logging.info(usage_summary())
+        logging.info(latency.summary())
 
     logging.info("✅ All done.")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Scrape WebMD, Herbpathy and PFAF for every plant.")
+    parser.add_argument("--replay", action="store_true", help="re-parse archived pages instead of scraping (no network)")
+    parser.add_argument("--refresh", action="store_true", help=f"re-check sources older than {REFRESH_AFTER_DAYS} days, re-extract changed herbs")
+    parser.add_argument("--shard", action="store_true", help=f"share the plant list with other scrapper processes through {WORK_QUEUE_FILE}")
+    args = parser.parse_args()
+    main(replay=args.replay, refresh=args.refresh, shard=args.shard)
@@ -0,0 +1,29 @@
+import sys
+import types
+
+import pytest
+
+import cli
+
+
+def fake_module(monkeypatch, name):
+    calls = []
+    monkeypatch.setitem(sys.modules, name, types.SimpleNamespace(main=calls.append))
+    return calls
+
+
+def test_extract_passes_options_to_async_extractor(monkeypatch):
+    calls = fake_module(monkeypatch, "async_extractor")
+    cli.main(["extract", "--concurrency", "8"])  # as documented in readme.md
+    assert calls == [["--concurrency", "8"]]
+
+
+def test_extract_batch_passes_options_to_batch_extractor(monkeypatch):
+    calls = fake_module(monkeypatch, "batch_extractor")
+    cli.main(["extract", "batch", "ingest", "--results", "out.jsonl"])
+    assert calls == [["ingest", "--results", "out.jsonl"]]
+
+
+def test_other_commands_still_reject_unknown_options():
+    with pytest.raises(SystemExit):
+        cli.main(["status", "--concurrency", "8"])
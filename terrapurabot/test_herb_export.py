@@ -0,0 +1,13 @@
+from herb_export import HerbExporter
+
+
+def test_tags_differing_only_in_case_are_one_tag(tmp_path):
+    exporter = HerbExporter(str(tmp_path / "herbs.sqlite"))
+    herb = {"Herb": {"LatinName": "Aloe vera", "Tags": ["skin", "Burns"]}, "Tags": [{"Name": "Skin"}, {"Name": "burns "}]}
+    try:
+        assert exporter.export([("aloe vera", herb)]) == (1, 0, 0)
+        tags = exporter.conn.execute("SELECT name FROM tags WHERE latin_key = 'aloe vera' ORDER BY name").fetchall()
+        assert tags == [("Burns",), ("skin",)]
+        assert exporter.conn.execute("SELECT latin_key FROM tags WHERE name = 'SKIN'").fetchall() == [("aloe vera",)]
+    finally:
+        exporter.close()
@@ -0,0 +1,37 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class SiteLimiter:
+    """Caps how many workers may hit each site at once and spaces their requests out."""
+
+    def __init__(self, concurrency=None, min_interval=None):
+        concurrency = concurrency or {}
+        self.min_interval = min_interval or {}
+        self._semaphores = {site: threading.BoundedSemaphore(n) for site, n in concurrency.items()}
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, site):
+        semaphore = self._semaphores.get(site)
+        if semaphore:
+            semaphore.acquire()
+        try:
+            self._wait_turn(site)
+            yield
+        finally:
+            if semaphore:
+                semaphore.release()
+
+    def _wait_turn(self, site):
+        interval = self.min_interval.get(site, 0)
+        if interval <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_slot.get(site, 0))
+            self._next_slot[site] = start + interval
+        if start > now:
+            time.sleep(start - now)
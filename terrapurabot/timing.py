@@ -0,0 +1,87 @@
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds, in seconds.
+BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, math.inf)
+
+
+class LatencyTracker:
+    """Latency per (site, step), used both to report where the time goes and to size waits.
+
+    `timeout()` returns the default until a step has `min_samples` samples, then p99 of the
+    recent window times `margin`, clamped to [floor, ceiling]. Timeouts are counted but kept out of
+    the window: a wait that never ends (e.g. for an element the page does not have) says nothing
+    about how long the step takes, and would otherwise push every later wait up to the ceiling.
+    """
+
+    def __init__(self, margin=1.5, min_samples=20, floor=1.0, ceiling=30.0, window=500):
+        self.margin = margin
+        self.min_samples = min_samples
+        self.floor = floor
+        self.ceiling = ceiling
+        self._recent = defaultdict(lambda: deque(maxlen=window))
+        self._histograms = defaultdict(lambda: [0] * len(BUCKETS))
+        self._totals = defaultdict(float)
+        self._counts = defaultdict(int)
+        self._timeouts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, site, step, seconds):
+        key = (site, step)
+        with self._lock:
+            self._recent[key].append(seconds)
+            self._histograms[key][next(i for i, bound in enumerate(BUCKETS) if seconds <= bound)] += 1
+            self._totals[key] += seconds
+            self._counts[key] += 1
+
+    def record_timeout(self, site, step, waited):
+        with self._lock:
+            self._timeouts[(site, step)] += 1
+            self._totals[(site, step)] += waited
+
+    @contextmanager
+    def timed(self, site, step):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(site, step, time.perf_counter() - start)
+
+    def percentile(self, site, step, q):
+        with self._lock:
+            samples = sorted(self._recent[(site, step)])
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def timeout(self, site, step, default):
+        with self._lock:
+            enough = len(self._recent[(site, step)]) >= self.min_samples
+        if not enough:
+            return default
+        return min(self.ceiling, max(self.floor, self.percentile(site, step, 0.99) * self.margin))
+
+    def snapshot(self):
+        """{(site, step): (bucket counts, total seconds, timeouts)} for exporting."""
+        with self._lock:
+            return {key: (list(self._histograms[key]), self._totals[key], self._timeouts[key]) for key in self._totals}
+
+    def summary(self):
+        with self._lock:
+            keys = sorted(set(self._totals))
+            grand_total = sum(self._totals.values()) or 1
+            rows = [(key, self._counts[key], self._timeouts[key], self._totals[key], list(self._histograms[key])) for key in keys]
+
+        lines = [f"{'site/step':<24}{'n':>7}{'t/o':>6}{'p50':>8}{'p90':>8}{'p99':>8}{'total s':>10}{'share':>7}"]
+        for (site, step), count, timeouts, total, histogram in rows:
+            p50, p90, p99 = (self.percentile(site, step, q) or 0 for q in (0.5, 0.9, 0.99))
+            lines.append(
+                f"{site + '/' + step:<24}{count:>7}{timeouts:>6}{p50:>8.2f}{p90:>8.2f}{p99:>8.2f}"
+                f"{total:>10.1f}{total / grand_total:>7.0%}"
+            )
+            buckets = " ".join(f"≤{bound:g}s:{n}" for bound, n in zip(BUCKETS, histogram) if n)
+            lines.append(f"{'':<24}{buckets}")
+        return "Latency by site/step:\n" + "\n".join(lines)
@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    latin_name TEXT PRIMARY KEY,
+    idx INTEGER NOT NULL,
+    plant TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state, idx);
+"""
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    """Herbs to scrape, shared by several scrapper processes (on one host or several sharing a filesystem).
+
+    A worker claims one herb at a time under a lease; while it works, a heartbeat keeps pushing the
+    lease forward. A lease that runs out (the worker died or hung) puts the herb back up for grabs,
+    up to `max_attempts` claims, after which it is marked failed. Every claim runs in an IMMEDIATE
+    transaction, so two workers never get the same herb.
+
+    The default rollback journal is used rather than WAL: WAL needs shared memory and only works
+    between processes on the same host.
+    """
+
+    def __init__(self, path, max_attempts=3):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._conn.executescript(SCHEMA)
+
+    def _write(self, statements):
+        """Run `statements(conn)` in one IMMEDIATE transaction and return what it returns."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def fill(self, plants, latin_name_of):
+        """Add every plant not queued yet (safe to call from each worker); returns how many were added."""
+        rows = [(latin_name_of(plant), idx, json.dumps(plant, ensure_ascii=False)) for idx, plant in enumerate(plants, 1)]
+        rows = [row for row in rows if row[0]]
+        return self._write(lambda conn: conn.executemany(
+            "INSERT OR IGNORE INTO jobs (latin_name, idx, plant) VALUES (?, ?, ?)", rows
+        ).rowcount)
+
+    def claim(self, worker, lease_seconds):
+        """(idx, plant) of the next free herb, now leased to `worker`; None when nothing is left to claim."""
+        def statements(conn):
+            now = time.time()
+            # Leases that ran out on their last allowed attempt are given up on.
+            conn.execute(
+                "UPDATE jobs SET state = 'failed', owner = NULL, updated_at = ? "
+                "WHERE state = 'leased' AND lease_until < ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            )
+            row = conn.execute(
+                "SELECT latin_name, idx, plant FROM jobs "
+                "WHERE state = 'pending' OR (state = 'leased' AND lease_until < ?) ORDER BY idx LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET state = 'leased', owner = ?, lease_until = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE latin_name = ?",
+                (worker, now + lease_seconds, now, row[0]),
+            )
+            return row[1], json.loads(row[2])
+        return self._write(statements)
+
+    def heartbeat(self, worker, lease_seconds):
+        """Extend every lease `worker` holds; returns how many it still holds."""
+        now = time.time()
+        return self._write(lambda conn: conn.execute(
+            "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE state = 'leased' AND owner = ?",
+            (now + lease_seconds, now, worker),
+        ).rowcount)
+
+    def finish(self, worker, latin_name, ok=True):
+        """Mark a claimed herb done, or hand it back (failed for good after `max_attempts` claims).
+
+        False if the lease had already gone to another worker, whose result then stands as well.
+        """
+        def statements(conn):
+            if ok:
+                state = "done"
+            else:
+                row = conn.execute("SELECT attempts FROM jobs WHERE latin_name = ?", (latin_name,)).fetchone()
+                state = "failed" if row and row[0] >= self.max_attempts else "pending"
+            return conn.execute(
+                "UPDATE jobs SET state = ?, owner = NULL, lease_until = NULL, updated_at = ? "
+                "WHERE latin_name = ? AND state = 'leased' AND owner = ?",
+                (state, time.time(), latin_name, worker),
+            ).rowcount == 1
+        return self._write(statements)
+
+    def release(self, worker):
+        """Hand back whatever `worker` still holds (on a clean shutdown), without using up an attempt."""
+        return self._write(lambda conn: conn.execute(
+            "UPDATE jobs SET state = 'pending', owner = NULL, lease_until = NULL, attempts = MAX(attempts - 1, 0), updated_at = ? "
+            "WHERE state = 'leased' AND owner = ?",
+            (time.time(), worker),
+        ).rowcount)
+
+    def counts(self):
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+            counts["expired"] = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = 'leased' AND lease_until < ?", (time.time(),)
+            ).fetchone()[0]
+        return counts
+
+    def active_workers(self):
+        """Workers holding a lease that has not run out."""
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT DISTINCT owner FROM jobs WHERE state = 'leased' AND lease_until >= ?", (time.time(),)
+            )]
+
+    def close(self):
+        self._conn.close()
+
+
+class LeaseKeeper(threading.Thread):
+    """Heartbeats a worker's leases every `lease_seconds / 3`, so a herb that takes long is not reclaimed."""
+
+    def __init__(self, queue, worker, lease_seconds):
+        super().__init__(name="lease-keeper", daemon=True)
+        self.queue = queue
+        self.worker = worker
+        self.lease_seconds = lease_seconds
+        self._stopping = threading.Event()
+
+    def run(self):
+        while not self._stopping.wait(self.lease_seconds / 3):
+            try:
+                self.queue.heartbeat(self.worker, self.lease_seconds)
+            except sqlite3.Error as e:
+                logging.warning(f"Lease heartbeat failed for {self.worker}: {e}")
+
+    def close(self):
+        self._stopping.set()
+        self.join()
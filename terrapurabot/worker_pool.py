@@ -0,0 +1,87 @@
+import logging
+import queue
+import threading
+
+from scrapper import (
+    SITE_CONCURRENCY,
+    SITE_MIN_INTERVAL,
+    get_latin_name,
+    new_driver,
+    process_plant,
+    save_result,
+)
+from metrics import metrics
+from throttle import SiteLimiter
+
+class ResultWriter(threading.Thread):
+    """The only thread allowed to touch the record store or write the output files.
+
+    Workers call `commit()`, which just queues the update for the writer to apply.
+    """
+
+    def __init__(self, store, sink):
+        super().__init__(name="result-writer", daemon=True)
+        self.store = store
+        self.sink = sink
+        self.updates = queue.Queue()
+
+    def commit(self, latin_name, updates, extracted=None):
+        self.updates.put((latin_name, updates, extracted))
+
+    def close(self):
+        self.updates.put(None)
+        self.join()
+
+    def run(self):
+        while True:
+            item = self.updates.get()
+            if item is None:
+                break
+            save_result(self.store, self.sink, *item)
+
+
+def _worker(worker_id, jobs, total, writer, limiter):
+    with new_driver(f"worker-{worker_id}") as driver:
+        while True:
+            try:
+                idx, plant, latin_name, entry = jobs.get_nowait()
+            except queue.Empty:
+                break
+            logging.info(f"[worker {worker_id}] [{idx}/{total}] Processing: {latin_name}")
+            try:
+                process_plant(driver, plant, latin_name, entry, writer.commit, limiter)
+            except Exception as e:
+                logging.error(f"[worker {worker_id}] Failed on {latin_name}: {e}")
+            metrics.inc("terrapura_herbs_done_total")
+
+
+def run_pool(plants, store, sink, workers):
+    jobs = queue.Queue()
+    for idx, plant in enumerate(plants, 1):
+        latin_name = get_latin_name(plant)
+        if not latin_name:
+            logging.warning(f"Skipping entry with no Latin name at index {idx}")
+            continue
+        # Entries are created up front so workers only ever read them.
+        jobs.put((idx, plant, latin_name, store.get(latin_name)))
+
+    writer = ResultWriter(store, sink)
+    writer.start()
+    limiter = SiteLimiter(SITE_CONCURRENCY, SITE_MIN_INTERVAL)
+
+    def export_queue_depths(registry):
+        registry.set("terrapura_queue_depth", jobs.qsize(), queue="jobs")
+        registry.set("terrapura_queue_depth", writer.updates.qsize(), queue="writer")
+
+    metrics.add_collector(export_queue_depths)
+
+    threads = [
+        threading.Thread(target=_worker, args=(n, jobs, len(plants), writer, limiter), name=f"scrape-worker-{n}")
+        for n in range(1, workers + 1)
+    ]
+    logging.info(f"Starting pool with {workers} drivers for {jobs.qsize()} plants")
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    writer.close()